@@ -0,0 +1,316 @@
+import os
+import struct
+import threading
+import time
+from array import array
+import heapq
+from collections import Counter, OrderedDict, deque
+
+from logbook import Logger
+
+from json_dict import atomic_write
+
+log = Logger("ActivityStore")
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+WEEK_DAYS = 7
+
+
+class BucketCounter:
+    """Message counts in fixed-width time buckets, kept in a fixed-size ring."""
+    __slots__ = ("width", "counts", "mark")
+
+    def __init__(self, width, slots):
+        self.width = width
+        self.counts = array("I", bytes(4 * slots))
+        self.mark = 0  # Number (ts // width) of the newest bucket written to.
+
+    def add(self, ts, n=1):
+        bucket = int(ts // self.width)
+        slots = len(self.counts)
+        if bucket > self.mark:
+            if bucket - self.mark >= slots:
+                self.counts = array("I", bytes(4 * slots))
+            else:
+                for stale in range(self.mark + 1, bucket + 1):
+                    self.counts[stale % slots] = 0
+            self.mark = bucket
+        elif bucket <= self.mark - slots:
+            return  # Older than anything we keep.
+        self.counts[bucket % slots] += n
+
+    def recent(self, now, n):
+        """Counts for the n buckets up to and including the one holding now, oldest first."""
+        bucket = int(now // self.width)
+        slots = len(self.counts)
+        counts = self.counts
+        oldest_kept = self.mark - slots
+        return [counts[b % slots] if oldest_kept < b <= self.mark else 0
+                for b in range(bucket - min(n, slots) + 1, bucket + 1)]
+
+
+class UserActivity:
+    __slots__ = ("nick", "last_seen", "recent", "hours", "days")
+
+    def __init__(self, nick, history_size, hour_slots, day_slots):
+        self.nick = nick
+        self.last_seen = 0.0
+        self.recent = deque(maxlen=history_size)  # (ts, channel, message), oldest first
+        self.hours = BucketCounter(HOUR, hour_slots)
+        self.days = BucketCounter(DAY, day_slots)
+
+
+class ActivityStore:
+    """Recent messages and hourly/daily message counts per user and per channel, with hard memory caps.
+
+    Every user keeps at most history_size messages of at most max_message_length characters, plus
+    fixed-size hourly and daily counters. At most max_users users are tracked; the one seen least
+    recently is dropped to make room, weekly totals and all. The store is saved to its own binary file (see save()) every
+    save_interval seconds and on close().
+    """
+    MAGIC = b"SMACT\x01"
+
+    def __init__(self, filename, max_users=2000, history_size=10, max_message_length=300,
+                 hour_slots=48, day_slots=35, save_interval=60):
+        self._filename = filename
+        self.max_users = max_users
+        self.history_size = history_size
+        self.max_message_length = max_message_length
+        self.hour_slots = hour_slots
+        self.day_slots = day_slots
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # lowercased nick -> UserActivity, least recently seen first
+        self._channels = {}  # lowercased channel -> (hourly BucketCounter, daily BucketCounter)
+        self._week = Counter()  # lowercased nick -> messages over the last WEEK_DAYS days, today included
+        self._week_days = deque()  # (day number, Counter) for each of those days, oldest first
+        self._dirty = False
+        self.load()
+        self._stop = threading.Event()
+        if save_interval:
+            threading.Thread(target=self._save_timer, args=(save_interval,), name="ActivityStore save",
+                             daemon=True).start()
+
+    def record(self, nick, channel, message, ts=None):
+        ts = time.time() if ts is None else ts
+        key = nick.lower()
+        with self._lock:
+            user = self._users.get(key)
+            if user is None:
+                user = self._users[key] = UserActivity(nick, self.history_size, self.hour_slots, self.day_slots)
+                if len(self._users) > self.max_users:
+                    evicted, _ = self._users.popitem(last=False)
+                    self._forget_week(evicted)
+            else:
+                self._users.move_to_end(key)
+            user.last_seen = ts
+            user.recent.append((ts, channel, message[:self.max_message_length]))
+            user.hours.add(ts)
+            user.days.add(ts)
+            hours, days = self._channel(channel)
+            hours.add(ts)
+            days.add(ts)
+            self._count_week(key, ts)
+            self._dirty = True
+
+    def _count_week(self, key, ts, n=1):
+        day = int(ts // DAY)
+        self._roll_week(day)
+        first = self._week_days[0][0]
+        if day < first:
+            return  # Outside the window.
+        self._week_days[day - first][1][key] += n
+        self._week[key] += n
+
+    def _forget_week(self, key):
+        # An evicted user's weekly counts go with them, so the totals stay within max_users too.
+        self._week.pop(key, None)
+        for _, counts in self._week_days:
+            counts.pop(key, None)
+
+    def _roll_week(self, day):
+        # Keeps one entry per day, with no gaps, ending with the newest day we've heard of.
+        if not self._week_days:
+            self._week_days.append((day, Counter()))
+        for number in range(max(self._week_days[-1][0] + 1, day - WEEK_DAYS + 1), day + 1):
+            self._week_days.append((number, Counter()))
+        while self._week_days[0][0] <= self._week_days[-1][0] - WEEK_DAYS:
+            _, expired = self._week_days.popleft()
+            for key, n in expired.items():
+                left = self._week[key] - n
+                if left > 0:
+                    self._week[key] = left
+                else:
+                    del self._week[key]
+
+    def _channel(self, channel):
+        counters = self._channels.get(channel.lower())
+        if counters is None:
+            counters = self._channels[channel.lower()] = (BucketCounter(HOUR, self.hour_slots),
+                                                          BucketCounter(DAY, self.day_slots))
+        return counters
+
+    def history(self, nick, n=None):
+        """The last n (ts, channel, message) tuples nick sent, oldest first."""
+        with self._lock:
+            user = self._users.get(nick.lower())
+            if user is None:
+                return []
+            recent = list(user.recent)
+        return recent[-n:] if n else recent
+
+    def user_hourly(self, nick, hours=24, now=None):
+        """Message counts for each of the last `hours` hours, oldest first, or None for an unknown nick."""
+        user = self._users.get(nick.lower())
+        return user.hours.recent(now or time.time(), hours) if user is not None else None
+
+    def user_daily(self, nick, days=7, now=None):
+        user = self._users.get(nick.lower())
+        return user.days.recent(now or time.time(), days) if user is not None else None
+
+    def channel_hourly(self, channel, hours=24, now=None):
+        counters = self._channels.get(channel.lower())
+        return counters[0].recent(now or time.time(), hours) if counters is not None else [0] * hours
+
+    def most_active(self, limit=5, now=None):
+        """[(nick, messages)] for the busiest users over the last seven days, busiest first."""
+        with self._lock:
+            self._roll_week(int((now or time.time()) // DAY))
+            top = heapq.nlargest(limit, self._week.items(), key=lambda item: item[1])
+            return [(self._users[key].nick, count) for key, count in top]
+
+    def __len__(self):
+        return len(self._users)
+
+    # On-disk format, all little-endian:
+    #   MAGIC, then u16 history_size, u16 hour_slots, u16 day_slots
+    #   u32 channel count, then per channel: str name, counter hours, counter days
+    #   u32 user count (least recently seen first), then per user:
+    #       str nick, f64 last_seen, counter hours, counter days,
+    #       u16 message count, then per message: f64 ts, str channel, str message
+    # where str is a u16 byte length plus UTF-8, and counter is an i64 mark plus one u32 per slot.
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            out = bytearray(self.MAGIC)
+            out += struct.pack("<HHH", self.history_size, self.hour_slots, self.day_slots)
+            out += struct.pack("<I", len(self._channels))
+            for name, (hours, days) in self._channels.items():
+                _pack_str(out, name)
+                _pack_counter(out, hours)
+                _pack_counter(out, days)
+            out += struct.pack("<I", len(self._users))
+            for user in self._users.values():
+                _pack_str(out, user.nick)
+                out += struct.pack("<d", user.last_seen)
+                _pack_counter(out, user.hours)
+                _pack_counter(out, user.days)
+                out += struct.pack("<H", len(user.recent))
+                for ts, channel, message in user.recent:
+                    out += struct.pack("<d", ts)
+                    _pack_str(out, channel)
+                    _pack_str(out, message)
+            self._dirty = False
+        atomic_write(self._filename, out)
+
+    def load(self):
+        """Read the saved store, if there is one. A file that can't be read is moved aside to
+        "<filename>.bad", and the store starts empty rather than failing every record() call."""
+        try:
+            with open(self._filename, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        try:
+            self._load(data)
+        except (ValueError, struct.error) as e:
+            self._channels.clear()
+            self._users.clear()
+            os.replace(self._filename, self._filename + ".bad")
+            log.error("Couldn't read {}: {}. Moved it to {}.bad and starting empty.", self._filename, e, self._filename)
+            return
+        today = int(time.time() // DAY)
+        self._roll_week(today - WEEK_DAYS + 1)
+        for key, user in self._users.items():  # The weekly totals aren't saved; rebuild them from the daily counters.
+            for offset, n in enumerate(user.days.recent(today * DAY, WEEK_DAYS)):
+                if n:
+                    self._count_week(key, (today - WEEK_DAYS + 1 + offset) * DAY, n)
+
+    def _load(self, data):
+        if not data.startswith(self.MAGIC):
+            raise ValueError("{} is not an activity store file".format(self._filename))
+        reader = _Reader(data, len(self.MAGIC))
+        history_size, hour_slots, day_slots = reader.unpack("<HHH")
+        if (hour_slots, day_slots) != (self.hour_slots, self.day_slots):
+            return  # Counters with a different layout can't be reused; start over.
+        for _ in range(reader.unpack("<I")[0]):
+            name = reader.str()
+            self._channels[name] = (reader.counter(HOUR, hour_slots), reader.counter(DAY, day_slots))
+        for _ in range(reader.unpack("<I")[0]):
+            user = UserActivity(reader.str(), self.history_size, hour_slots, day_slots)
+            user.last_seen = reader.unpack("<d")[0]
+            user.hours = reader.counter(HOUR, hour_slots)
+            user.days = reader.counter(DAY, day_slots)
+            for _ in range(reader.unpack("<H")[0]):
+                user.recent.append((reader.unpack("<d")[0], reader.str(), reader.str()))
+            self._users[user.nick.lower()] = user
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def _save_timer(self, interval):
+        while not self._stop.wait(interval):
+            self.save()
+
+    def close(self):
+        self._stop.set()
+        self.save()
+
+
+def _pack_str(out, text):
+    data = text.encode("utf-8")[:0xFFFF]
+    out += struct.pack("<H", len(data))
+    out += data
+
+
+def _pack_counter(out, counter):
+    out += struct.pack("<q", counter.mark)
+    counts = counter.counts
+    if not _LITTLE_ENDIAN:
+        counts = array("I", counts)
+        counts.byteswap()
+    out += counts.tobytes()
+
+
+class _Reader:
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def str(self):
+        length = self.unpack("<H")[0]
+        if self.offset + length > len(self.data):
+            raise ValueError("truncated file")
+        text = self.data[self.offset:self.offset + length].decode("utf-8", errors="replace")
+        self.offset += length
+        return text
+
+    def counter(self, width, slots):
+        counter = BucketCounter(width, 0)
+        counter.mark = self.unpack("<q")[0]
+        if self.offset + 4 * slots > len(self.data):
+            raise ValueError("truncated file")
+        counter.counts.frombytes(self.data[self.offset:self.offset + 4 * slots])
+        if not _LITTLE_ENDIAN:
+            counter.counts.byteswap()
+        self.offset += 4 * slots
+        return counter
+
+
+_LITTLE_ENDIAN = struct.pack("=H", 1) == struct.pack("<H", 1)
@@ -0,0 +1,27 @@
+import random
+
+
+class Backoff:
+    """Delays for retrying something that keeps failing: exponential, capped, and jittered.
+
+    Each delay is the exponential step times a random factor between 1 - jitter and 1, so many
+    clients cut off by the same netsplit don't all come back at the same moment.
+    """
+
+    def __init__(self, initial_delay=1, max_delay=300, factor=2, jitter=0.5, rng=random):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self._rng = rng
+        self.attempts = 0
+
+    def next_delay(self):
+        """Seconds to wait before the next attempt."""
+        step = min(self.max_delay, self.initial_delay * self.factor ** min(self.attempts, 64))
+        self.attempts += 1
+        return step * (1 - self.jitter * self._rng.random())
+
+    def reset(self):
+        """Call after a success, so the next failure starts over from initial_delay."""
+        self.attempts = 0
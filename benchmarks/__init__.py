@@ -0,0 +1 @@
+# Benchmarks for RollBot. Run them from the repository root, e.g. `python -m benchmarks.json_dict`.
@@ -0,0 +1,197 @@
+"""Run a real RollBot process against the scripted server in benchmarks.irc_server and measure it.
+
+The bot runs in a scratch directory with its own config and data files. The run has three phases:
+
+  chatter   --chatter PRIVMSGs in #TagProMods from --nicks different nicks, all tracked in mods.json.
+            The rate is --rate lines a second, or as fast as the bot keeps up with if it is 0.
+  commands  --bursts bursts of --burst-size commands sent at once, mixing !tell, !mods and !seen.
+            Some chatter between bursts delivers the queued tells.
+  shutdown  the owner sends !quit.
+
+It reports the chatter throughput, reply latency percentiles for each command and the bot's RSS
+after each phase. Flood control and the command rate limits are turned up so high that they never
+kick in, so the latencies are the bot's own. Pass --flood-control to keep cconfig.json's outbound
+limits instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.irc_server import FakeIRCServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPORA = ["fortune.txt", "flirt.txt", "iWishTagProWas.txt", "raccoons.txt", "insults.txt"]
+BOT_NICK = "Smalls"
+OWNER = "benchowner"
+WORDS = ("gg", "anyone", "seen", "the", "griefer", "on", "radius", "again", "lol", "can", "a", "mod",
+         "check", "this", "replay", "ban", "please", "he", "keeps", "tagging", "his", "own", "team")
+
+
+def write_config(directory, port, flood_control):
+    with open(os.path.join(ROOT, "cconfig.json")) as f:
+        config = json.load(f)
+    config.update(server="127.0.0.1", port=port, botnick=BOT_NICK, password="bench", prefix="!",
+                  channel=["#TagProMods", "#TPmods"], owner={"nick": OWNER, "pass": ""},
+                  ipintel={"contact": "bench@example.com", "cache_file": "ipintel_cache.json"})
+    config.pop("metrics_port", None)
+    # The command limits drop commands rather than delay them, so they're always off here.
+    config["rate_limits"] = {"user_rate": 1e9, "user_burst": 1e9, "channel_rate": 1e9, "channel_burst": 1e9}
+    if not flood_control:
+        config["flood_control"] = {"rate": 1e9, "burst": 1e9, "target_rate": 1e9, "target_burst": 1e9}
+    with open(os.path.join(directory, "config.json"), "w") as f:
+        json.dump(config, f)
+    for name in CORPORA:
+        shutil.copy(os.path.join(ROOT, name), directory)
+
+
+def rss_kib(pid):
+    """Resident set size of pid in KiB, or None where /proc isn't available."""
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def chatter_line(i, nicks):
+    nick = "user{}".format(i % nicks)
+    text = " ".join(WORDS[(i * 7 + k * 3) % len(WORDS)] for k in range(3 + i % 9))
+    return ":{0}!{0}@1-2-3-{1}.isp.example PRIVMSG #TagProMods :{2}".format(nick, i % 255, text)
+
+
+async def send_chatter(server, start, count, nicks, rate):
+    started = time.perf_counter()
+    for i in range(start, start + count):
+        server.send(chatter_line(i, nicks))
+        if i % 256 == 255:
+            await server.drain()
+            if rate:
+                ahead = (i - start + 1) / rate - (time.perf_counter() - started)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+    await server.sync()
+    return time.perf_counter() - started
+
+
+async def command_burst(server, burst, size, nicks, timeout):
+    """Send size commands at once and return {command: [reply latencies]} plus how many got no reply."""
+    pending = []
+    for j in range(size):
+        probe = "probe{}x{}".format(burst, j)
+        other = "user{}".format((burst * size + j) % nicks)
+        kind = ("tell", "mods", "seen")[j % 3]
+        pending.append((kind, server.expect(probe)))
+        if kind == "tell":
+            server.send(":{0}!{0}@h.example PRIVMSG {1} :!tell {2} benchmark message {3}".format(probe, BOT_NICK, other, j))
+        elif kind == "mods":
+            server.send(":{0}!{0}@10-0-{1}-{2}.isp.example PRIVMSG #TPmods :!mods {3} is griefing".format(
+                probe, burst % 256, j % 256, other))
+        else:
+            server.send(":{0}!{0}@h.example PRIVMSG {1} :!seen {2}".format(probe, BOT_NICK, other))
+    await server.drain()
+    latencies = {}
+    missed = 0
+    for kind, future in pending:
+        try:
+            latencies.setdefault(kind, []).append(await asyncio.wait_for(future, timeout))
+        except asyncio.TimeoutError:
+            missed += 1
+    return latencies, missed
+
+
+async def run(args):
+    directory = tempfile.mkdtemp(prefix="rollbot-bench-")
+    members = ["+mod{}".format(i) for i in range(5)] + ["@admin{}".format(i) for i in range(2)]
+    members += ["user{}".format(i) for i in range(min(args.nicks, 200))]
+    server = FakeIRCServer(members=members)
+    await server.start()
+    write_config(directory, server.port, args.flood_control)
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    with open(os.path.join(directory, "bot.log"), "wb") as log:
+        bot = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", "import rollbot; rollbot.RollBot().connect()",
+            cwd=directory, env=env, stdout=log, stderr=asyncio.subprocess.STDOUT)
+    try:
+        started = time.perf_counter()
+        await server.wait_joined(["#TagProMods", "#TPmods"], timeout=30)
+        print("bot registered and joined in {:.2f}s".format(time.perf_counter() - started))
+        rss = [("connected", rss_kib(bot.pid))]
+
+        elapsed = await send_chatter(server, 0, args.chatter, args.nicks, args.rate)
+        print("chatter: {:,} lines from {:,} nicks in {:.2f}s ({:,.0f} lines/s)".format(
+            args.chatter, args.nicks, elapsed, args.chatter / elapsed))
+        rss.append(("after chatter", rss_kib(bot.pid)))
+
+        latencies = {}
+        missed = 0
+        sent = args.chatter
+        for burst in range(args.bursts):
+            burst_latencies, burst_missed = await command_burst(server, burst, args.burst_size, args.nicks,
+                                                                args.timeout)
+            for kind, values in burst_latencies.items():
+                latencies.setdefault(kind, []).extend(values)
+            missed += burst_missed
+            await send_chatter(server, sent, args.nicks, args.nicks, args.rate)  # Everyone speaks, so tells get delivered.
+            sent += args.nicks
+        rss.append(("after commands", rss_kib(bot.pid)))
+
+        print("command reply latency over {} bursts of {}:".format(args.bursts, args.burst_size))
+        print("  {:<8}{:>7}{:>10}{:>10}{:>10}{:>10}".format("command", "n", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+        everything = []
+        for kind in sorted(latencies) + ["all"]:
+            values = sorted(latencies[kind] if kind != "all" else everything)
+            if kind != "all":
+                everything.extend(values)
+            print("  {:<8}{:>7}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}".format(
+                kind, len(values), *(1000 * percentile(values, p) for p in (.5, .9, .99, 1))))
+        if missed:
+            print("  {} commands got no reply within {}s".format(missed, args.timeout))
+
+        print("bot RSS:")
+        for label, kib in rss:
+            print("  {:<16}{}".format(label, "{:,} KiB".format(kib) if kib is not None else "unknown"))
+        if rss[0][1] is not None:
+            print("  growth          {:+,} KiB".format(rss[-1][1] - rss[0][1]))
+
+        server.send(":{0}!{0}@h.example PRIVMSG {1} :!quit".format(OWNER, BOT_NICK))
+        await server.drain()
+        await asyncio.wait_for(bot.wait(), 15)
+    finally:
+        if bot.returncode is None:
+            bot.kill()
+            await bot.wait()
+        await server.close()
+        if args.keep:
+            print("bot files kept in", directory)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nicks", type=int, default=2000, help="distinct nicks chatting in #TagProMods")
+    parser.add_argument("--chatter", type=int, default=50000, help="PRIVMSGs in the chatter phase")
+    parser.add_argument("--rate", type=float, default=0, help="chatter lines a second (0: unthrottled)")
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--burst-size", type=int, default=90)
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for each reply")
+    parser.add_argument("--flood-control", action="store_true", help="keep cconfig.json's outbound limits")
+    parser.add_argument("--keep", action="store_true", help="keep the bot's scratch directory")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
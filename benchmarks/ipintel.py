@@ -0,0 +1,70 @@
+"""Hammer IPReputation with raid-like repeated checks against a local stub of getipintel.
+
+The stub answers after --latency seconds and counts the requests it gets, so the output shows how
+many lookups were served by the cache or merged with one already in flight.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ip_reputation import IPReputation
+
+
+def start_stub(latency):
+    """Start a getipintel look-alike on a free local port. Returns (server, base_url)."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            server.hits += 1
+            body = "{:.4f}".format(random.random()).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.hits = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:{}/check.php".format(server.server_address[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lookups", type=int, default=400)
+    parser.add_argument("--ips", type=int, default=20, help="distinct IPs the raid comes from")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent !check commands")
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server, base_url = start_stub(args.latency)
+    ips = ["10.0.{}.{}".format(i // 256, i % 256) for i in range(args.ips)]
+    cache_file = os.path.join(tempfile.mkdtemp(), "ipintel_cache.json")
+    reputation = IPReputation(base_url=base_url, contact="bench@example.com", cache_file=cache_file)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.workers) as pool:
+        list(pool.map(reputation.lookup, (random.choice(ips) for _ in range(args.lookups))))
+    elapsed = time.perf_counter() - started
+
+    print("{} lookups of {} IPs with {} workers in {:.2f}s ({:,.0f} lookups/s)".format(
+        args.lookups, args.ips, args.workers, elapsed, args.lookups / elapsed))
+    print("upstream requests: {} (uncached, one request each: {})".format(server.hits, args.lookups))
+
+    restarted = IPReputation(base_url=base_url, contact="bench@example.com", cache_file=cache_file)
+    before = server.hits
+    for ip in ips:
+        restarted.lookup(ip)
+    print("upstream requests after a restart with the saved cache: {}".format(server.hits - before))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
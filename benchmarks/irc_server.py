@@ -0,0 +1,147 @@
+"""A scripted IRC server for driving a real RollBot process in benchmarks.
+
+It speaks just enough of the protocol for the bot: registration (001), CAP REQ, JOIN and NAMES
+(353/366) with a configurable member list, and PING/PONG. Everything the bot sends is parsed, and
+benchmarks can wait for a PONG (`sync`) or for a reply mentioning a token (`expect`).
+"""
+import asyncio
+import itertools
+import time
+
+from irc_parser import parse
+
+
+class FakeIRCServer:
+    def __init__(self, host="127.0.0.1", port=0, members=()):
+        self.host = host
+        self.port = port
+        self.members = list(members)  # NAMES entries, with prefixes, e.g. ["+alice", "@bob"]
+        self.nick = None
+        self.lines_in = 0
+        self.joined = set()
+        self.registered = asyncio.Event()
+        self._writer = None
+        self._server = None
+        self._user_seen = False
+        self._connected = asyncio.Event()
+        self._closed = asyncio.Event()
+        self._join_waiters = []  # (set of channels, Future)
+        self._pongs = {}  # PING token -> Future
+        self._expected = {}  # lowercased token -> (Future, time it was expected)
+        self._tokens = itertools.count()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def wait_joined(self, channels, timeout=10):
+        """Wait for the bot to register and join every one of channels."""
+        await asyncio.wait_for(self.registered.wait(), timeout)
+        wanted = {channel.lower() for channel in channels}
+        if not wanted <= self.joined:
+            future = asyncio.get_running_loop().create_future()
+            self._join_waiters.append((wanted, future))
+            await asyncio.wait_for(future, timeout)
+
+    def send(self, line):
+        self._writer.write(line.encode("utf-8") + b"\r\n")
+
+    async def drain(self):
+        await self._writer.drain()
+
+    async def sync(self, timeout=60):
+        """PING the bot and wait for its PONG, i.e. until it has read everything sent before."""
+        token = "sync{}".format(next(self._tokens))
+        future = self._pongs[token] = asyncio.get_running_loop().create_future()
+        self.send("PING :" + token)
+        await self.drain()
+        await asyncio.wait_for(future, timeout)
+
+    def expect(self, token):
+        """A future for the seconds until the bot sends a PRIVMSG to, or mentioning, token (a nick)."""
+        future = asyncio.get_running_loop().create_future()
+        self._expected[token.lower()] = (future, time.perf_counter())
+        return future
+
+    async def wait_closed(self, timeout=10):
+        await asyncio.wait_for(self._closed.wait(), timeout)
+
+    async def _handle(self, reader, writer):
+        if self._writer is not None:
+            writer.close()  # One bot at a time.
+            return
+        self._writer = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.lines_in += 1
+                message = parse(line.decode("utf-8", errors="replace"))
+                if message is not None:
+                    self._dispatch(message)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self._closed.set()
+
+    def _dispatch(self, message):
+        command, args = message.command, message.args
+        if command == "PRIVMSG" and len(args) >= 2:
+            self._on_privmsg(args[0], args[1])
+        elif command == "PONG":
+            future = self._pongs.pop(args[-1].strip() if args else "", None)
+            if future is not None and not future.done():
+                future.set_result(None)
+        elif command == "PING":
+            self.send("PONG :" + (args[-1] if args else ""))
+        elif command == "NICK" and args:
+            self.nick = args[0]
+            self._register()
+        elif command == "USER":
+            self._user_seen = True
+            self._register()
+        elif command == "CAP" and args and args[0].upper() == "REQ":
+            self.send(":fake.server CAP * ACK :" + (args[-1] if len(args) > 1 else ""))
+        elif command == "JOIN" and args:
+            for channel in args[0].split(","):
+                self.joined.add(channel.lower())
+                self.send(":{0}!bot@fake.host JOIN {1}".format(self.nick, channel))
+                self._send_names(channel)
+            for wanted, future in self._join_waiters:
+                if wanted <= self.joined and not future.done():
+                    future.set_result(None)
+        elif command == "NAMES" and args:
+            self._send_names(args[0])
+        elif command == "QUIT":
+            self._writer.close()
+
+    def _register(self):
+        if self.nick and self._user_seen and not self.registered.is_set():
+            self.send(":fake.server 001 {} :Welcome to the benchmark network".format(self.nick))
+            self.send(":fake.server 005 {} PREFIX=(ov)@+ CHANTYPES=# :are supported".format(self.nick))
+            self.registered.set()
+
+    def _send_names(self, channel):
+        names = [self.nick] + self.members
+        for start in range(0, len(names), 50):
+            self.send(":fake.server 353 {} = {} :{}".format(self.nick, channel, " ".join(names[start:start + 50])))
+        self.send(":fake.server 366 {} {} :End of /NAMES list.".format(self.nick, channel))
+
+    def _on_privmsg(self, target, text):
+        if not self._expected:
+            return
+        for word in itertools.chain((target,), text.split()):
+            found = self._expected.pop(word.strip(",:").lower(), None)
+            if found is not None:
+                future, started = found
+                if not future.done():
+                    future.set_result(time.perf_counter() - started)
+                return
@@ -0,0 +1,70 @@
+"""Compare the full-rewrite JSONDict with the journaled one under a mods.json-like workload.
+
+Every write stores a fresh activity record for one of `--nicks` tracked nicks, the same thing
+run_loop does for each PRIVMSG in #TagProMods.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from json_dict import JSONDict, JournaledJSONDict
+
+
+def bytes_written():
+    # wchar counts every byte handed to write(), background threads included.
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def record(i):
+    return {"date": "2016-05-04T12:34:56.{:06d}+00:00".format(i % 1000000),
+            "message": "just a regular chat message number {}".format(i),
+            "channel": "#TagProMods"}
+
+
+def run(factory, nicks, writes):
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "mods.json")
+        d = factory(path)
+        for i in range(nicks):  # Start from a populated file, like a bot that has been up for a while.
+            dict.__setitem__(d, "nick{}".format(i), record(i))
+        d.save_dict()
+        if isinstance(d, JournaledJSONDict):
+            d.compact()
+        before = bytes_written()
+        started = time.perf_counter()
+        for i in range(writes):
+            d["nick{}".format(i % nicks)] = record(i)
+        if isinstance(d, JournaledJSONDict):
+            d.close()
+        elapsed = time.perf_counter() - started
+        after = bytes_written()
+        return writes / elapsed, (after - before) if before is not None else None
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nicks", type=int, default=500)
+    parser.add_argument("--writes", type=int, default=5000)
+    args = parser.parse_args()
+
+    print("{} writes over {} tracked nicks".format(args.writes, args.nicks))
+    for name, factory in (("JSONDict (full rewrite)", JSONDict),
+                          ("JournaledJSONDict", JournaledJSONDict)):
+        rate, written = run(factory, args.nicks, args.writes)
+        written = "n/a" if written is None else "{:.1f} MiB".format(written / 1024 / 1024)
+        print("{:<26} {:>12,.0f} writes/s   {:>10} written".format(name, rate, written))
+
+
+if __name__ == "__main__":
+    main()
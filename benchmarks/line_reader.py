@@ -0,0 +1,101 @@
+"""Compare ways of reading server lines off a socket, over the corpus from benchmarks.parser sent
+through a loopback TCP connection:
+
+  makefile        socket.makefile(encoding="utf-8", errors="ignore").readline(), the original
+                  blocking reader
+  StreamReader    asyncio's StreamReader.readline() and a decode per line, what run_loop used next
+  IRCConnection   irc_connection's recv_into() buffer and memoryview line splitting, decoded with
+                  decode_line
+
+Every reader ends up with the text of each line, the way run_loop needs it.
+"""
+import argparse
+import asyncio
+import socket
+import threading
+import time
+
+from benchmarks.parser import corpus
+from irc_connection import decode_line, open_connection
+
+
+def serve(data):
+    """Listen on a loopback port and send data to the first client that connects; returns the port."""
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def send():
+        client, _ = listener.accept()
+        with client:
+            client.sendall(data)
+        listener.close()
+
+    threading.Thread(target=send, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def read_makefile(port):
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        lines = sock.makefile(encoding="utf-8", errors="ignore")
+        count = 0
+        while lines.readline():
+            count += 1
+        return count
+
+
+async def read_streams(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    count = 0
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        line.decode("utf-8", errors="ignore")
+        count += 1
+    writer.close()
+    return count
+
+
+async def read_irc_connection(port):
+    connection = await open_connection("127.0.0.1", port)
+    count = 0
+    while True:
+        line = await connection.readline()
+        if not line:
+            break
+        decode_line(line)
+        count += 1
+    connection.close()
+    return count
+
+
+READERS = [
+    ("makefile", read_makefile),
+    ("StreamReader", lambda port: asyncio.run(read_streams(port))),
+    ("IRCConnection", lambda port: asyncio.run(read_irc_connection(port))),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = "".join(corpus(args.lines)).encode("utf-8")
+    print("{:,} lines ({:,} bytes), best of {}".format(args.lines, len(data), args.repeat))
+    baseline = None
+    for name, read in READERS:
+        best = float("inf")
+        for _ in range(args.repeat):
+            port = serve(data)
+            started = time.perf_counter()
+            count = read(port)
+            best = min(best, time.perf_counter() - started)
+            assert count == args.lines, (name, count)
+        baseline = baseline or best
+        print("{:<14} {:>12,.0f} lines/s  {:>7.2f} us/line  {:>5.2f}x".format(
+            name, args.lines / best, best / args.lines * 1e6, baseline / best))
+
+
+if __name__ == "__main__":
+    main()
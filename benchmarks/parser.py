@@ -0,0 +1,85 @@
+"""Compare irc_parser.parse with the regex + finditer parsing run_loop used to do, over a synthetic
+corpus shaped like a busy #TagProMods day (mostly PRIVMSGs, some joins/parts/modes, NAMES and PINGs).
+"""
+import argparse
+import random
+import re
+import time
+
+from irc_parser import parse
+
+MESSAGE_REGEX = re.compile(r"^(?:[:](?P<prefix>\S+) )"
+                           r"?(?P<type>\S+)"
+                           r"(?: (?!:)(?P<destination>.+?))"
+                           r"?(?: [:](?P<message>.+))?$")
+
+
+def regex_parse(message):
+    # The old run_loop path, step for step.
+    message_dict = [m.groupdict() for m in MESSAGE_REGEX.finditer(message)][0]
+    source_nick = ""
+    hostmask = ""
+    if message_dict['prefix'] is not None:
+        if "!" in message_dict['prefix']:
+            hostmask = message_dict['prefix'].split("@")[1]
+            source_nick = message_dict['prefix'].split("!")[0]
+    return source_nick, hostmask, message_dict
+
+
+def corpus(size, seed=36):
+    rng = random.Random(seed)
+    words = "gg mod tagpro ball flag pop boost spike team red blue cap hold grab return please help ip".split()
+    nicks = ["user{}".format(i) for i in range(300)]
+
+    def prefix():
+        nick = rng.choice(nicks)
+        return "{}!~{}@{}-{}-{}-{}.res.example.net".format(nick, nick[:8], *(rng.randrange(256) for _ in range(4)))
+
+    def text():
+        return " ".join(rng.choice(words) for _ in range(rng.randrange(1, 25)))
+
+    makers = [
+        (70, lambda: ":{} PRIVMSG #TagProMods :{}".format(prefix(), text())),
+        (6, lambda: "@time=2016-05-04T12:00:00.000Z;account={} :{} PRIVMSG #TPmods :{}".format(
+            rng.choice(nicks), prefix(), text())),
+        (5, lambda: ":{} JOIN #TPmods".format(prefix())),
+        (5, lambda: ":{} PART #TPmods :{}".format(prefix(), text())),
+        (4, lambda: ":{} QUIT :Quit: {}".format(prefix(), text())),
+        (3, lambda: ":ChanServ!ChanServ@services. MODE #TPmods +v {}".format(rng.choice(nicks))),
+        (3, lambda: ":irc.example.net 353 Smalls = #TPmods :{}".format(
+            " ".join(rng.choice(["", "+", "@"]) + n for n in rng.sample(nicks, 40)))),
+        (2, lambda: "PING :irc.example.net"),
+        (2, lambda: ":irc.example.net 372 Smalls :- {}".format(text())),
+    ]
+    weighted = [maker for weight, maker in makers for _ in range(weight)]
+    return [rng.choice(weighted)() + "\r\n" for _ in range(size)]
+
+
+def measure(function, lines, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for line in lines:
+            function(line)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = corpus(args.lines)
+    print("{:,} lines, best of {}".format(len(lines), args.repeat))
+    baseline = None
+    for name, function in (("regex + finditer", regex_parse), ("irc_parser.parse", parse)):
+        elapsed = measure(function, lines, args.repeat)
+        baseline = baseline or elapsed
+        print("{:<18} {:>12,.0f} lines/s  {:>7.2f} us/line  {:>5.2f}x".format(
+            name, len(lines) / elapsed, elapsed / len(lines) * 1e6, baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main()
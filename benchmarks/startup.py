@@ -0,0 +1,93 @@
+"""How long RollBot takes to start: importing rollbot, and launching the bot until it has joined its
+channels on the scripted server from benchmarks.irc_server. Each is the median of --runs fresh
+interpreters. Also lists the slowest imports, from python -X importtime.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.end_to_end import ROOT, write_config
+from benchmarks.irc_server import FakeIRCServer
+
+
+def time_import(directory):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import rollbot"], cwd=directory, check=True,
+                   env=dict(os.environ, PYTHONPATH=ROOT))
+    return time.perf_counter() - started
+
+
+def slowest_imports(directory, count):
+    """[(cumulative microseconds, module)] for the slowest modules rollbot imports directly, and the
+    time spent running rollbot's own module code."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import rollbot"], cwd=directory,
+                            env=dict(os.environ, PYTHONPATH=ROOT), stderr=subprocess.PIPE, text=True, check=True)
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # The header.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:  # Children are listed before the module that imported them.
+            if name.strip() == "rollbot":
+                children.append((int(own), "(rollbot's own code)"))
+                return sorted(children, reverse=True)[:count]
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative), name.strip()))
+    return []
+
+
+async def time_to_join(directory):
+    server = FakeIRCServer()
+    await server.start()
+    write_config(directory, server.port, flood_control=True)
+    started = time.perf_counter()
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", "import rollbot; rollbot.RollBot().connect()", cwd=directory,
+        env=dict(os.environ, PYTHONPATH=ROOT), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await server.wait_joined(["#TagProMods", "#TPmods"], timeout=30)
+        return time.perf_counter() - started
+    finally:
+        bot.kill()
+        await bot.wait()
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--mods", type=int, default=20000, help="records in the mods.json the bot starts with")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="rollbot-startup-")
+    try:
+        with open(os.path.join(directory, "mods.json"), "w") as f:
+            f.write("{" + ",".join('"user{0}": {{"ts": {1}, "message": "hi", "channel": "#TagProMods"}}'.format(
+                i, 1.5e9 + i) for i in range(args.mods)) + "}")
+        write_config(directory, 6667, flood_control=True)
+        subprocess.run([sys.executable, "-c", "import rollbot"], cwd=directory, env=dict(os.environ, PYTHONPATH=ROOT),
+                       check=True)  # Warm the bytecode and OS caches.
+        imports = [time_import(directory) for _ in range(args.runs)]
+        joins = [asyncio.run(time_to_join(directory)) for _ in range(args.runs)]
+        print("import rollbot:            {:7.1f} ms (median of {})".format(1000 * statistics.median(imports), args.runs))
+        print("start to joined channels:  {:7.1f} ms (median of {}, {:,} mods records)".format(
+            1000 * statistics.median(joins), args.runs, args.mods))
+        print("slowest imports made by rollbot (cumulative):")
+        for microseconds, name in slowest_imports(directory, 10):
+            print("  {:7.1f} ms  {}".format(microseconds / 1000, name))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import threading
+
+
+class Channel:
+    def __init__(self, name, joined):
+        self.name = name
+        self.joined = joined  # We only see JOIN/PART/MODE traffic for channels we're in.
+        self.members = {}  # lowercased nick -> [nick, set of prefix mode letters]
+        self.stale = True
+        self.synced = threading.Event()
+
+
+class ChannelState:
+    """Members of each channel and their prefix modes (+v, +o, ...), kept current from server events.
+
+    Feed every line to handle() from the read loop. A channel's member list is rebuilt from the
+    353/366 NAMES reply the server sends when we join, then maintained from JOIN, PART, QUIT, KICK,
+    NICK and MODE. Commands read it through members()/modes(), and only need a fresh NAMES
+    (see needs_sync) when we aren't in the channel or an event left us unsure.
+    """
+
+    def __init__(self, nick):
+        self.nick = nick
+        self.multi_prefix = False  # Whether NAMES lists every prefix a member has, not just the highest.
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._names = {}  # lowercased channel -> members collected from 353s until the 366
+        self._set_prefixes("ov", "@+")
+        self._set_chanmodes("beI", "k", "l")
+
+    def _set_prefixes(self, modes, symbols):
+        self.prefix_modes = modes
+        self.symbol_modes = dict(zip(symbols, modes))
+
+    def _set_chanmodes(self, lists, always, on_set):
+        self.list_modes = lists  # All of these take a parameter when set, except
+        self.always_arg_modes = always
+        self.set_arg_modes = on_set  # these, which only do when being set.
+
+    def disconnected(self):
+        """Mark every channel as left and stale, but keep the member lists: they're still the best
+        guess until the NAMES reply that comes with rejoining replaces them."""
+        with self._lock:
+            self._names.clear()
+            for channel in self._channels.values():
+                channel.joined = False
+                channel.stale = True
+
+    def handle(self, nick, command, params):
+        """Update state from one server message. params includes the trailing parameter, if any."""
+        handler = self._handlers.get(command)
+        if handler is not None and params:
+            with self._lock:
+                handler(self, nick, params)
+
+    def _on_isupport(self, nick, params):  # 005
+        for token in params[1:-1]:
+            key, _, value = token.partition("=")
+            if key == "PREFIX" and value.startswith("("):
+                modes, _, symbols = value[1:].partition(")")
+                self._set_prefixes(modes, symbols)
+            elif key == "CHANMODES":
+                parts = value.split(",") + ["", "", ""]
+                self._set_chanmodes(parts[0], parts[1], parts[2])
+
+    def _on_cap(self, nick, params):
+        if len(params) >= 3 and params[1] == "ACK" and "multi-prefix" in params[2].split():
+            self.multi_prefix = True
+
+    def _on_names(self, nick, params):  # 353: <me> <symbol> <channel> :<names>
+        if len(params) < 4:
+            return
+        collected = self._names.setdefault(params[2].lower(), {})
+        for name in params[3].split():
+            modes = set()
+            while name and name[0] in self.symbol_modes:
+                modes.add(self.symbol_modes[name[0]])
+                name = name[1:]
+            if name:
+                collected[name.lower()] = [name, modes]
+
+    def _on_end_of_names(self, nick, params):  # 366: <me> <channel> :End of /NAMES list.
+        if len(params) < 2:
+            return
+        key = params[1].lower()
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = Channel(params[1], joined=False)
+        channel.members = self._names.pop(key, {})
+        channel.stale = not channel.joined  # Nobody tells us when a channel we're not in changes.
+        channel.synced.set()
+
+    def _on_join(self, nick, params):
+        key = params[0].lower()
+        if nick.lower() == self.nick.lower():
+            channel = self._channels.get(key)
+            if channel is None:
+                channel = self._channels[key] = Channel(params[0], joined=True)
+            channel.joined = True
+            channel.stale = True  # Members arrive in the NAMES reply the server sends next, which replaces these.
+        else:
+            channel = self._channels.get(key)
+            if channel is None:
+                return
+        channel.members[nick.lower()] = [nick, set()]
+
+    def _on_part(self, nick, params):
+        self._remove(params[0].lower(), nick)
+
+    def _on_kick(self, nick, params):
+        if len(params) >= 2:
+            self._remove(params[0].lower(), params[1])
+
+    def _remove(self, key, nick):
+        if nick.lower() == self.nick.lower():
+            self._channels.pop(key, None)
+        elif key in self._channels:
+            self._channels[key].members.pop(nick.lower(), None)
+
+    def _on_quit(self, nick, params):
+        for channel in self._channels.values():
+            channel.members.pop(nick.lower(), None)
+
+    def _on_nick(self, nick, params):
+        new_nick = params[-1]
+        if nick.lower() == self.nick.lower():
+            self.nick = new_nick
+        for channel in self._channels.values():
+            member = channel.members.pop(nick.lower(), None)
+            if member is not None:
+                member[0] = new_nick
+                channel.members[new_nick.lower()] = member
+
+    def _on_mode(self, nick, params):  # MODE <channel> <modes> [args...]
+        channel = self._channels.get(params[0].lower())
+        if channel is None or len(params) < 2:
+            return  # User mode, or a channel we don't track.
+        adding = True
+        args = iter(params[2:])
+        for letter in params[1]:
+            if letter in "+-":
+                adding = letter == "+"
+            elif letter in self.prefix_modes:
+                target = next(args, None)
+                member = channel.members.get(target.lower()) if target else None
+                if member is None:
+                    channel.stale = True
+                elif adding:
+                    member[1].add(letter)
+                else:
+                    member[1].discard(letter)
+                    if not self.multi_prefix:
+                        channel.stale = True  # NAMES only showed their highest prefix; they may hold a lower one.
+            elif letter in self.list_modes or letter in self.always_arg_modes or (adding and letter in self.set_arg_modes):
+                next(args, None)
+
+    _handlers = {
+        "005": _on_isupport,
+        "CAP": _on_cap,
+        "353": _on_names,
+        "366": _on_end_of_names,
+        "JOIN": _on_join,
+        "PART": _on_part,
+        "KICK": _on_kick,
+        "QUIT": _on_quit,
+        "NICK": _on_nick,
+        "MODE": _on_mode,
+    }
+
+    def needs_sync(self, channel):
+        """True if channel's member list can't be trusted, in which case the caller should send NAMES
+        and then wait_synced(). Marks the channel as waiting for that reply."""
+        key = channel.lower()
+        with self._lock:
+            current = self._channels.get(key)
+            if current is None:
+                current = self._channels[key] = Channel(channel, joined=False)
+            elif not current.stale and current.synced.is_set():
+                return False
+            current.synced.clear()
+            return True
+
+    def wait_synced(self, channel, timeout=None):
+        current = self._channels.get(channel.lower())
+        return current is not None and current.synced.wait(timeout)
+
+    def members(self, channel):
+        """{nick: set of prefix mode letters} for everyone we know to be in channel."""
+        with self._lock:
+            current = self._channels.get(channel.lower())
+            if current is None:
+                return {}
+            return {nick: set(modes) for nick, modes in current.members.values()}
+
+    def modes(self, channel, nick):
+        """The set of prefix mode letters nick has in channel, or None if they aren't in it."""
+        with self._lock:
+            current = self._channels.get(channel.lower())
+            member = current.members.get(nick.lower()) if current is not None else None
+            return set(member[1]) if member is not None else None
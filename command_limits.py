@@ -0,0 +1,77 @@
+import time
+
+from outbound import TokenBucket, sweep_buckets
+
+
+class CommandLimiter:
+    """Flood protection for commands: a token bucket per (user, command) and one per channel.
+
+    A command runs only if both its user's bucket and its channel's bucket have a token; private
+    messages only count against the user. Users are keyed by host rather than nick, so changing nick
+    doesn't get a spammer a fresh bucket. Idle buckets are swept away (see outbound.sweep_buckets), so
+    memory stays bounded however many users come and go.
+    """
+    SWEEP_INTERVAL = 60  # seconds
+
+    def __init__(self, user_rate=0.2, user_burst=3, channel_rate=0.5, channel_burst=5, commands=None,
+                 notice=True, clock=time.monotonic):
+        self.user_rate = user_rate  # commands per second
+        self.user_burst = user_burst
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.commands = {key.lower(): limits for key, limits in (commands or {}).items()}  # name -> {rate, burst}
+        self.notice = notice  # Tell a throttled user once, or drop their commands silently.
+        self._clock = clock
+        self._users = {}  # (user, command) -> TokenBucket
+        self._channels = {}  # lowercased channel -> TokenBucket
+        self._noticed = set()  # Users told they're throttled since their last command that ran.
+        self._last_sweep = clock()
+
+    def check(self, user, command, channel=None):
+        """Take a token for user running command (in channel, if it's not a private message).
+
+        Returns None if the command may run, otherwise which limit it hit: "user" or "channel".
+        """
+        now = self._clock()
+        if now - self._last_sweep > self.SWEEP_INTERVAL:
+            self._sweep(now)
+        limits = self.commands.get(command, {})
+        user_bucket = self._bucket(self._users, (user.lower(), command), limits.get('rate', self.user_rate),
+                                   limits.get('burst', self.user_burst), now)
+        if user_bucket.tokens < 1:
+            return "user"
+        channel_bucket = None
+        if channel is not None:
+            channel_bucket = self._bucket(self._channels, channel.lower(), self.channel_rate, self.channel_burst, now)
+            if channel_bucket.tokens < 1:
+                return "channel"
+            channel_bucket.tokens -= 1
+        user_bucket.tokens -= 1
+        self._noticed.discard(user.lower())
+        return None
+
+    def should_notify(self, user):
+        """Whether to tell user they're being throttled: only the first time until a command of theirs runs again."""
+        if not self.notice or user.lower() in self._noticed:
+            return False
+        self._noticed.add(user.lower())
+        return True
+
+    def __len__(self):
+        return len(self._users) + len(self._channels)
+
+    @staticmethod
+    def _bucket(buckets, key, rate, burst, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst, now)
+        else:
+            bucket.refill(now)
+        return bucket
+
+    def _sweep(self, now):
+        sweep_buckets(self._users, now)
+        sweep_buckets(self._channels, now)
+        active = {user for user, _ in self._users}
+        self._noticed &= active
+        self._last_sweep = now
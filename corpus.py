@@ -0,0 +1,167 @@
+import mmap
+import os
+import random
+import re
+import struct
+import threading
+import time
+from array import array
+
+from json_dict import atomic_write
+
+
+class Corpus:
+    """Random and matching lines from a text file, read through mmap instead of into memory.
+
+    The start offset of every non-blank line is kept in an index file next to the corpus
+    ("<file>.idx"), which is mapped too, so a lookup touches a few pages no matter how big the file
+    is. The index records the corpus's mtime and size and is rebuilt when they change. The corpus
+    is re-checked at most every check_interval seconds.
+    """
+    INDEX_MAGIC = b"SMIDX\x01"
+    HEADER = struct.Struct("<6sxxqqQ")  # magic, padding, mtime_ns, size, line count
+    MAX_SEARCH_MATCHES = 10000
+
+    def __init__(self, filename, index_filename=None, check_interval=5):
+        self.filename = filename
+        self.index_filename = index_filename or filename + ".idx"
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked = 0
+        self._data = None
+        self._index = None
+        self._offsets = ()
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._offsets)
+
+    def random_line(self, rng=random):
+        with self._lock:
+            self._refresh()
+            if not self._offsets:
+                return None
+            return self._line_at(self._offsets[rng.randrange(len(self._offsets))])
+
+    def search(self, text, rng=random):
+        """A random line containing text (case-insensitive), or None if no line does."""
+        pattern = re.compile(re.escape(text.encode("utf-8")), re.IGNORECASE)
+        with self._lock:
+            self._refresh()
+            if not self._offsets:
+                return None
+            data = self._data
+            chosen = None
+            seen = 0
+            position = 0
+            while seen < self.MAX_SEARCH_MATCHES:
+                match = pattern.search(data, position)
+                if match is None:
+                    break
+                start = data.rfind(b"\n", 0, match.start()) + 1
+                seen += 1
+                if rng.randrange(seen) == 0:  # Reservoir sampling: every matching line is equally likely.
+                    chosen = start
+                position = data.find(b"\n", match.end())
+                if position == -1:
+                    break
+            return self._line_at(chosen) if chosen is not None else None
+
+    def _line_at(self, start):
+        end = self._data.find(b"\n", start)
+        if end == -1:
+            end = len(self._data)
+        return self._data[start:end].decode("utf-8", errors="replace").strip()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._stamp is not None and now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        stat = os.stat(self.filename)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp:
+            self._open(stamp)
+
+    def _open(self, stamp):
+        self._close()
+        self._stamp = stamp
+        if not stamp[1]:
+            return  # mmap can't map an empty file.
+        with open(self.filename, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if not self._load_index(stamp):
+            self._build_index(stamp)
+            self._load_index(stamp)
+
+    def _load_index(self, stamp):
+        try:
+            with open(self.index_filename, "rb") as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return False
+        if len(index) < self.HEADER.size:
+            index.close()
+            return False
+        magic, mtime_ns, size, count = self.HEADER.unpack_from(index)
+        if magic != self.INDEX_MAGIC or (mtime_ns, size) != stamp or len(index) != self.HEADER.size + 8 * count:
+            index.close()
+            return False
+        self._index = index
+        self._offsets = memoryview(index)[self.HEADER.size:].cast("Q")
+        return True
+
+    def _build_index(self, stamp):
+        data = self._data
+        offsets = array("Q")
+        start = 0
+        length = len(data)
+        while start < length:
+            end = data.find(b"\n", start)
+            if end == -1:
+                end = length
+            if data[start:end].strip():
+                offsets.append(start)
+            start = end + 1
+        atomic_write(self.index_filename, self.HEADER.pack(self.INDEX_MAGIC, stamp[0], stamp[1], len(offsets))
+                     + offsets.tobytes())
+
+    def _close(self):
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._offsets = ()
+        for mapped in (self._index, self._data):
+            if mapped is not None:
+                mapped.close()
+        self._index = self._data = None
+
+
+def corpus_command(name, filename, template="{line}", targeted=False):
+    """Make a bot command serving random lines from filename. Register it with @command.
+
+    The reply is template filled in with {line}, {source} and {target}. A targeted command treats its
+    first argument as the nick to aim the line at (default: whoever asked); otherwise any arguments
+    are searched for in the corpus.
+    """
+    corpus = Corpus(filename)  # Nothing is opened until the command is first used.
+
+    def method(self, hostmask, source, reply_to, *args):
+        target = source
+        if targeted and args:
+            target = args[0]
+            line = corpus.random_line()
+        elif args:
+            line = corpus.search(' '.join(args))
+            if line is None:
+                return "Sorry, nothing in my {} list matches that.".format(name)
+        else:
+            line = corpus.random_line()
+        if line is None:
+            return None
+        return template.format(line=line, source=source, target=target)
+
+    method.__name__ = name
+    method.corpus = corpus
+    return method
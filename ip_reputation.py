@@ -0,0 +1,151 @@
+import concurrent.futures
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from json_dict import atomic_write
+
+IP_IN_HOSTMASK = re.compile(r'\b(?:\d{1,3}[\.-]){3}\d{1,3}\b')
+SCORE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def extract_ip(hostmask):
+    """The dotted IP address embedded in a hostmask like 1-2-3-4.isp.net, or None."""
+    match = IP_IN_HOSTMASK.search(hostmask)
+    return match.group(0).replace("-", ".") if match else None
+
+
+class IPReputationError(Exception):
+    pass
+
+
+class IPReputation:
+    """Looks up how likely an IP is to be a proxy/VPN, using getipintel.net.
+
+    Results are kept in a TTL + LRU cache that is saved to cache_file, so they survive restarts.
+    Requests share one keep-alive session, at most max_in_flight of them run at once, and concurrent
+    lookups of the same IP wait on a single request instead of each making their own.
+    """
+    URL = "http://check.getipintel.net/check.php"
+
+    def __init__(self, base_url=URL, contact=None, contact_file="email.txt", cache_file="ipintel_cache.json",
+                 ttl=6 * 60 * 60, max_entries=4096, max_in_flight=2, timeout=10):
+        self.base_url = base_url
+        self.contact_file = contact_file
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.requests_made = 0
+        self._contact = contact
+        self._session = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Held while writing cache_file, so lookups never wait on the disk.
+        self._generation = 0  # Bumped on every change to the cache...
+        self._saved_generation = 0  # ...and this is the one last written to cache_file.
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._cache = OrderedDict()  # ip -> (expiry as a unix timestamp, score), least recently used first
+        self._in_flight = {}  # ip -> concurrent.futures.Future shared by everyone waiting on that ip
+        self._load()
+
+    @property
+    def contact(self):
+        if self._contact is None:
+            with open(self.contact_file) as f:
+                self._contact = f.read().strip()
+        return self._contact
+
+    @property
+    def session(self):
+        if self._session is None:
+            from requests import Session  # Only needed once someone actually runs a check.
+            from requests.adapters import HTTPAdapter
+            session = Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    def lookup(self, ip):
+        """The probability (0 to 1) that ip is a bad actor. Raises IPReputationError if the service can't say."""
+        with self._lock:
+            cached = self._cache.get(ip)
+            if cached is not None:
+                if cached[0] > time.time():
+                    self._cache.move_to_end(ip)
+                    return cached[1]
+                del self._cache[ip]
+            pending = self._in_flight.get(ip)
+            leader = pending is None
+            if leader:
+                pending = self._in_flight[ip] = concurrent.futures.Future()
+        if not leader:
+            return pending.result(timeout=self.timeout * 2)
+
+        try:
+            score = self._fetch(ip)
+            self._store(ip, score)  # Cached before we stop being in flight, so no one slips in between.
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[ip]
+        pending.set_result(score)
+        return score
+
+    def _fetch(self, ip):
+        with self._slots:
+            self.requests_made += 1
+            response = self.session.get(self.base_url, params={"ip": ip, "contact": self.contact},
+                                        timeout=self.timeout)
+        response.raise_for_status()
+        try:
+            score = float(response.text)
+        except ValueError:
+            found = SCORE.search(response.text)
+            if found is None:
+                raise IPReputationError("Unexpected response: {!r}".format(response.text[:100]))
+            score = float(found.group(0))
+        if score < 0:  # getipintel reports errors as negative numbers.
+            raise IPReputationError("getipintel returned error {}".format(score))
+        return score
+
+    def _store(self, ip, score):
+        with self._lock:
+            self._cache[ip] = (time.time() + self.ttl, score)
+            self._cache.move_to_end(ip)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            self._generation += 1
+            generation = self._generation
+            snapshot = dict(self._cache) if self.cache_file else None
+        self._save(generation, snapshot)
+
+    def _load(self):
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file) as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        now = time.time()
+        for ip, (expires, score) in sorted(entries.items(), key=lambda item: item[1][0]):
+            if expires > now:
+                self._cache[ip] = (expires, score)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _save(self, generation, snapshot):
+        if not self.cache_file:
+            return
+        with self._save_lock:
+            if generation <= self._saved_generation:
+                return  # Another thread already wrote a newer snapshot.
+            atomic_write(self.cache_file, json.dumps(snapshot))
+            self._saved_generation = generation
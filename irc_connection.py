@@ -0,0 +1,151 @@
+"""The bot's connection to the server: lines in as bytes, data out with flow control.
+
+IRCConnection is a BufferedProtocol, so the event loop recv_into()s straight into one reusable
+bytearray instead of handing over a new bytes object per read, and lines are split out of it in
+place through a memoryview. The only copy a line gets is the bytes object readline() returns.
+Decoding is left to the caller (decode_line), so the raw bytes can be kept as they came.
+"""
+import asyncio
+from collections import deque
+
+
+def decode_line(line):
+    """Text of a raw line. Most clients send UTF-8; what isn't valid UTF-8 is taken as latin-1
+    (the usual legacy encoding on IRC) rather than having its accented letters dropped."""
+    try:
+        return line.decode("utf-8")
+    except UnicodeDecodeError:
+        return line.decode("latin-1")
+
+
+class IRCConnection(asyncio.BufferedProtocol):
+    # The longest line allowed: 512 bytes of message plus 8191 of IRCv3 tags and the space after them.
+    MAX_LINE_LENGTH = 8704
+    BUFFER_SIZE = 65536
+    MAX_QUEUED_LINES = 4096  # Stop reading from the socket while this many lines wait for readline().
+
+    def __init__(self, max_line_length=MAX_LINE_LENGTH, buffer_size=BUFFER_SIZE):
+        if buffer_size <= max_line_length + 1:
+            raise ValueError("buffer_size must be larger than max_line_length + 1")
+        self.max_line_length = max_line_length
+        self.transport = None
+        self.overlong_lines = 0  # Lines dropped for being longer than max_line_length.
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # Where the unfinished line at the end of the buffer begins...
+        self._end = 0  # ...and where the data received so far ends.
+        self._discarding = False  # In the middle of an overlong line, skipping to its end.
+        self._lines = deque()
+        self._eof = False
+        self._exception = None
+        self._paused = False
+        self._line_waiter = None
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+
+    # Reading.
+
+    async def readline(self):
+        """The next line, as bytes without its line ending, or b"" once the connection has closed."""
+        while not self._lines:
+            if self._exception is not None:
+                raise self._exception
+            if self._eof:
+                return b""
+            self._line_waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._line_waiter
+            finally:
+                self._line_waiter = None
+        line = self._lines.popleft()
+        if self._paused and len(self._lines) < self.MAX_QUEUED_LINES // 2:
+            self._paused = False
+            self.transport.resume_reading()
+        return line
+
+    def get_buffer(self, sizehint):
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        buffer, view = self._buffer, self._view
+        end = self._end + nbytes
+        start = self._start
+        newline = buffer.find(b"\n", self._end, end)
+        while newline != -1:
+            if self._discarding:
+                self._discarding = False
+            else:
+                stop = newline - 1 if newline > start and buffer[newline - 1] == 13 else newline  # 13 is \r
+                if stop - start > self.max_line_length:
+                    self.overlong_lines += 1
+                elif stop > start:
+                    self._lines.append(bytes(view[start:stop]))
+            start = newline + 1
+            newline = buffer.find(b"\n", start, end)
+
+        tail = end - start
+        if tail > self.max_line_length and not self._discarding:
+            if tail > self.max_line_length + 1 or buffer[end - 1] != 13:  # Allow for a \r whose \n is still to come.
+                self._discarding = True  # Drop what we have of it, and the rest.
+                self.overlong_lines += 1
+        if self._discarding:
+            start = end
+        if start == end:
+            start = end = 0
+        elif end > len(buffer) - self.max_line_length:  # Make room: move the unfinished line to the front.
+            view[:end - start] = view[start:end]
+            start, end = 0, end - start
+        self._start, self._end = start, end
+
+        if self._lines:
+            self._wake()
+            if not self._paused and len(self._lines) >= self.MAX_QUEUED_LINES:
+                self._paused = True
+                self.transport.pause_reading()
+
+    def eof_received(self):
+        self._eof = True
+        self._wake()
+        return False  # Close the transport.
+
+    # Writing.
+
+    def write(self, data):
+        self.transport.write(data)
+
+    async def drain(self):
+        """Wait while the transport's write buffer is full, i.e. the server isn't reading."""
+        if self.transport.is_closing():
+            raise ConnectionResetError("Connection lost")
+        await self._can_write.wait()
+
+    def pause_writing(self):
+        self._can_write.clear()
+
+    def resume_writing(self):
+        self._can_write.set()
+
+    # The connection itself.
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self._eof = True
+        self._exception = exc
+        self._can_write.set()  # drain() sees the transport closing and raises.
+        self._wake()
+
+    def close(self):
+        self.transport.close()
+
+    def _wake(self):
+        if self._line_waiter is not None and not self._line_waiter.done():
+            self._line_waiter.set_result(None)
+
+
+async def open_connection(host, port, **kwargs):
+    """Connect to host:port; returns the IRCConnection. kwargs go to IRCConnection."""
+    loop = asyncio.get_running_loop()
+    _, connection = await loop.create_connection(lambda: IRCConnection(**kwargs), host, port)
+    return connection
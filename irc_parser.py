@@ -0,0 +1,90 @@
+"""Parsing of raw IRC lines, including IRCv3 message tags.
+
+    @time=2016-05-04T12:00:00.000Z :nick!user@host PRIVMSG #channel :hello there
+    `---------- tags ----------'  `--- prefix ---' command  params  `-trailing-'
+"""
+
+_TAG_ESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+
+class Message:
+    __slots__ = ("tags", "prefix", "nick", "user", "host", "command", "params", "trailing")
+
+    def __init__(self, tags, prefix, nick, user, host, command, params, trailing):
+        self.tags = tags  # dict, or None if the line had no tags
+        self.prefix = prefix  # "nick!user@host" or a server name, or None
+        self.nick = nick  # None if the prefix is a server
+        self.user = user
+        self.host = host
+        self.command = command  # Upper-cased; numeric replies stay as strings like "353".
+        self.params = params  # Middle parameters, not including the trailing one.
+        self.trailing = trailing  # The parameter after " :", or None.
+
+    @property
+    def args(self):
+        """Every parameter, trailing included."""
+        if self.trailing is None:
+            return self.params
+        return self.params + [self.trailing]
+
+    @property
+    def numeric(self):
+        """The reply number for numeric replies (001, 353...), otherwise None."""
+        return int(self.command) if self.command.isdigit() else None
+
+    def __repr__(self):
+        return "Message({!r}, {!r}, {!r}, {!r}, tags={!r})".format(self.prefix, self.command, self.params,
+                                                                   self.trailing, self.tags)
+
+
+def parse_tags(raw):
+    tags = {}
+    for tag in raw.split(";"):
+        key, _, value = tag.partition("=")
+        if "\\" in value:
+            value = _unescape(value)
+        tags[key] = value
+    return tags
+
+
+def _unescape(value):
+    out = []
+    chars = iter(value)
+    for char in chars:
+        if char == "\\":
+            escaped = next(chars, "")
+            out.append(_TAG_ESCAPES.get(escaped, escaped))
+        else:
+            out.append(char)
+    return "".join(out)
+
+
+def parse(line):
+    """Parse one line from the server into a Message, or return None for a blank line."""
+    line = line.rstrip("\r\n")
+    tags = None
+    if line[:1] == "@":
+        raw_tags, _, line = line[1:].partition(" ")
+        tags = parse_tags(raw_tags)
+        line = line.lstrip(" ")
+
+    prefix = nick = user = host = None
+    if line[:1] == ":":
+        prefix, _, line = line[1:].partition(" ")
+        if "!" in prefix:
+            nick, _, user = prefix.partition("!")
+            user, _, host = user.partition("@")
+        elif "@" in prefix:
+            nick, _, host = prefix.partition("@")
+        elif "." not in prefix:
+            nick = prefix
+
+    trailing = None
+    split_at = line.find(" :")
+    if split_at != -1:
+        trailing = line[split_at + 2:]
+        line = line[:split_at]
+    params = line.split()
+    if not params:
+        return None
+    return Message(tags, prefix, nick, user, host, params[0].upper(), params[1:], trailing)
@@ -1,4 +1,9 @@
 import json
+import os
+import tempfile
+import threading
+import time
+
 
 class JSONDict(dict):
     def __init__(self, filename, **kwargs):
@@ -9,10 +14,10 @@ class JSONDict(dict):
     def __setitem__(self, item, val):
         super().__setitem__(item.lower(), val)
         self.save_dict()
-        
+
     def __getitem__(self, item):
         return super().__getitem__(item.lower())
-        
+
     def __contains__(self, item):
         return super().__contains__(item.lower())
 
@@ -26,6 +31,208 @@ class JSONDict(dict):
             with open(self._filename) as f:
                 data = json.load(f)
                 for k, v in data.items():
-                    self[k] = v
+                    super().__setitem__(k.lower(), v)  # Don't rewrite the whole file once per loaded key.
         except FileNotFoundError:
             pass
+
+
+class JournaledJSONDict(JSONDict):
+    """A JSONDict that appends changes to a journal instead of rewriting the whole file on every assignment.
+
+    Changed keys are buffered in memory and appended to "<filename>.journal" as JSON lines once
+    `max_dirty` keys are pending or `flush_interval` seconds have passed. When the journal grows past
+    `compact_bytes` it is folded back into the snapshot file by a background thread. The snapshot file
+    keeps the exact format JSONDict uses, so the two can be swapped freely. Call close() on shutdown.
+    """
+
+    def __init__(self, filename, flush_interval=5.0, max_dirty=64, compact_bytes=1024 * 1024, **kwargs):
+        self._lock = threading.RLock()
+        self._dirty = {}
+        self._journal_name = filename + ".journal"
+        self._compacting_name = filename + ".compacting"
+        self._journal = None
+        self._journal_size = 0
+        self._compactor = None
+        self._compact_error = None
+        self._closed = False
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.compact_bytes = compact_bytes
+        self.on_flush = None  # Optional callback, called with the seconds spent on each journal flush.
+        super().__init__(filename, **kwargs)
+        if os.path.exists(self._compacting_name):
+            atomic_write(self._filename, json.dumps(dict(self.items())))
+            os.remove(self._compacting_name)
+        self._open_journal()
+        self._wakeup = threading.Event()
+        self._timer = threading.Thread(target=self._flush_timer, name="JSONDict flush " + filename, daemon=True)
+        self._timer.start()
+
+    def __setitem__(self, item, val):
+        key = item.lower()
+        with self._lock:
+            dict.__setitem__(self, key, val)
+            self._dirty[key] = val
+            if len(self._dirty) >= self.max_dirty:
+                self.flush()
+
+    def __delitem__(self, item):
+        key = item.lower()
+        with self._lock:
+            dict.__delitem__(self, key)
+            self._dirty[key] = _DELETED
+            if len(self._dirty) >= self.max_dirty:
+                self.flush()
+
+    def save_dict(self):
+        self.flush()
+
+    def load_dict(self):
+        super().load_dict()
+        # A leftover .compacting file means we died mid-compaction. Replaying it is harmless either way,
+        # since every entry in it is either already in the snapshot or newer than it.
+        for name in (self._compacting_name, self._journal_name):
+            self._replay(name)
+
+    def _replay(self, name):
+        try:
+            with open(name) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # A torn final write; everything after it is garbage.
+                    if "d" in entry:
+                        dict.pop(self, entry["d"], None)
+                    else:
+                        dict.__setitem__(self, entry["k"], entry["v"])
+        except FileNotFoundError:
+            pass
+
+    def _open_journal(self):
+        self._journal = open(self._journal_name, "a")
+        self._journal_size = self._journal.tell()
+
+    def flush(self):
+        """Append every pending change to the journal in a single write."""
+        with self._lock:
+            if not self._dirty or self._journal is None:
+                return
+            started = time.perf_counter()
+            lines = []
+            for key, val in self._dirty.items():
+                if val is _DELETED:
+                    lines.append(json.dumps({"d": key}))
+                else:
+                    lines.append(json.dumps({"k": key, "v": val}))
+            lines.append("")
+            data = "\n".join(lines)
+            self._journal.write(data)
+            self._journal.flush()
+            self._journal_size += len(data)
+            self._dirty.clear()
+            if self._journal_size >= self.compact_bytes and self._compactor is None:
+                self._start_compaction()
+        if self.on_flush is not None:
+            self.on_flush(time.perf_counter() - started)
+
+    def _start_compaction(self):
+        # Called with the lock held. Swap in a fresh journal so writers never wait on the snapshot.
+        self._journal.close()
+        if os.path.exists(self._compacting_name):
+            # A compaction failed, so its entries aren't in the snapshot yet. Keep them, followed by the journal's.
+            with open(self._journal_name) as journal, open(self._compacting_name, "a") as compacting:
+                compacting.write(journal.read())
+            os.remove(self._journal_name)
+        else:
+            os.replace(self._journal_name, self._compacting_name)
+        self._open_journal()
+        snapshot = dict(self.items())
+        self._compactor = threading.Thread(target=self._compact, args=(snapshot,),
+                                           name="JSONDict compact " + self._filename, daemon=True)
+        self._compactor.start()
+
+    def _compact(self, snapshot):
+        try:
+            atomic_write(self._filename, json.dumps(snapshot))
+            os.remove(self._compacting_name)
+        except BaseException as e:
+            self._compact_error = e  # The .compacting file stays, to be folded into the next compaction.
+            raise
+        finally:
+            with self._lock:
+                self._compactor = None
+
+    def compact(self):
+        """Fold the journal into the snapshot file and wait for it to finish.
+
+        If a compaction was already running, the changes made since it started get folded in too,
+        so when this returns the snapshot file holds everything. Raises if a compaction fails.
+        """
+        while True:
+            with self._lock:
+                self.flush()
+                if self._compactor is None:
+                    if not self._journal_size and not os.path.exists(self._compacting_name):
+                        return
+                    self._compact_error = None
+                    self._start_compaction()
+                compactor = self._compactor
+            compactor.join()
+            error, self._compact_error = self._compact_error, None
+            if error is not None:
+                raise error
+
+    def _flush_timer(self):
+        while not self._wakeup.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Flush everything and write a final snapshot. Safe to call more than once."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        self.compact()
+        with self._lock:
+            self._journal.close()
+            self._journal = None
+            if os.path.exists(self._journal_name) and not os.path.getsize(self._journal_name):
+                os.remove(self._journal_name)
+
+
+class WatchedJSONFile:
+    """A JSON file that is only re-read when it changes on disk."""
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._stamp = None
+        self._data = None
+
+    def get(self):
+        stat = os.stat(self._filename)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp:
+            with open(self._filename) as f:
+                self._data = json.load(f)
+            self._stamp = stamp
+        return self._data
+
+
+_DELETED = object()
+
+
+def atomic_write(filename, data):
+    """Replace filename with data (str or bytes). Readers, and the file after a crash, only ever
+    see the old contents or the new ones."""
+    fd, temp_name = tempfile.mkstemp(prefix=os.path.basename(filename) + ".", dir=os.path.dirname(filename) or ".")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(data, (bytes, bytearray)) else "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_name, filename)
+    except BaseException:
+        os.remove(temp_name)
+        raise
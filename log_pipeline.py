@@ -0,0 +1,135 @@
+"""Logging that stays off the event loop.
+
+Records go onto a bounded queue and a background thread formats them and writes them out, so a
+slow or backed-up stdout stalls that thread instead of the bot. If the queue fills up, records are
+dropped (and the drop is reported once there's room again) rather than blocking.
+
+Raw server lines aren't logged one by one. RawLineLog keeps the most recent ones in a ring buffer
+for the owner's dump command, and logs only every Nth one, at DEBUG.
+"""
+import atexit
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+import logbook
+
+from irc_connection import decode_line
+
+_installed = None
+
+
+def json_formatter(record, handler):
+    """One JSON object per line: time, level, channel, message, any extra fields and the exception."""
+    entry = {
+        "time": record.time.isoformat(),
+        "level": record.level_name,
+        "channel": record.channel,
+        "message": record.message,
+    }
+    if record.extra:
+        entry["extra"] = dict(record.extra)
+    if record.exc_info:
+        entry["exception"] = record.formatted_exception
+    return json.dumps(entry, default=str)
+
+
+class QueueHandler(logbook.Handler):
+    """Hands records to a background thread, which passes them on to handler."""
+
+    def __init__(self, handler, maxsize=10000, level=logbook.NOTSET, bubble=False):
+        logbook.Handler.__init__(self, level=level, bubble=bubble)
+        self.handler = handler
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name="log writer", daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        record.keep_open = True  # Otherwise the logger closes it (dropping exc_info) before the writer gets to it.
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            record.keep_open = False
+            self.dropped += 1
+
+    def _run(self):
+        reported = 0
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self.handler.handle(record)
+            record.close()
+            if self.dropped != reported and self._queue.empty():
+                missed, reported = self.dropped - reported, self.dropped
+                warning = logbook.LogRecord("log_pipeline", logbook.WARNING,
+                                            "Dropped {} log records; the log queue was full", (missed,))
+                warning.heavy_init()
+                self.handler.handle(warning)
+
+    def close(self, timeout=2):
+        """Write out whatever is queued (waiting at most timeout seconds) and stop the thread."""
+        if self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+        self.handler.close()
+
+
+def install(config):
+    """Send every log record through a QueueHandler, configured by the config's "logging" section.
+
+    Only the first call sets anything up; later ones return the same handler.
+    """
+    global _installed
+    if _installed is None:
+        stream = logbook.StreamHandler(sys.stdout, level=config.get("level", "INFO"))
+        if config.get("format", "text") == "json":
+            stream.formatter = json_formatter
+        _installed = QueueHandler(stream, config.get("queue_size", 10000))
+        _installed.push_application()
+        atexit.register(_installed.close)
+    return _installed
+
+
+class RawLineLog:
+    """The last ring_size raw lines from the server, plus a 1-in-sample_every sample of them at DEBUG.
+
+    Recording a line is an append; the level check and the formatting only happen for sampled lines.
+    """
+
+    def __init__(self, logger, ring_size=1000, sample_every=0):
+        self.logger = logger
+        self.sample_every = sample_every  # 0 logs none of them.
+        self._lines = deque(maxlen=ring_size)  # (unix time, raw bytes), oldest first
+        self._countdown = sample_every
+
+    def record(self, line):
+        self._lines.append((time.time(), line))
+        if self.sample_every:
+            self._countdown -= 1
+            if self._countdown <= 0:
+                self._countdown = self.sample_every
+                if self.logger.level <= logbook.DEBUG:
+                    self.logger.debug("Received server message: {!r}", line)
+
+    def recent(self, n=None):
+        lines = list(self._lines)
+        return lines[-n:] if n else lines
+
+    def __len__(self):
+        return len(self._lines)
+
+
+def write_lines(filename, lines):
+    """Write (unix time, raw bytes) pairs to filename as timestamped text."""
+    with open(filename, "w", encoding="utf-8") as f:
+        for ts, line in lines:
+            f.write("{}.{:03d} {}\n".format(time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts)), int(ts % 1 * 1000),
+                                            decode_line(line).rstrip("\r\n")))
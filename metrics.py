@@ -0,0 +1,148 @@
+"""Just enough of a Prometheus client for RollBot: counters, gauges and histograms, rendered in the
+text exposition format and served over HTTP on a local port.
+
+Recording is a couple of attribute updates (plus a bisect for histograms); all the formatting
+happens when the endpoint is scraped.
+"""
+import asyncio
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.value = 0  # Unlabelled counters just bump this.
+        self._series = {}
+
+    def inc(self, amount=1, labels=None):
+        if labels is None:
+            self.value += amount
+        else:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def samples(self):
+        if not self.labelnames:
+            yield self.name, (), self.value
+        for labels, value in list(self._series.items()):  # Other threads may add series meanwhile.
+            yield self.name, tuple(zip(self.labelnames, labels)), value
+
+
+class Gauge:
+    def __init__(self, name, help, function=None, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.function = function  # Called at scrape time, if given.
+        self.value = 0
+        self._functions = {}
+
+    def set(self, value):
+        self.value = value
+
+    def track(self, labels, function):
+        """Report function() under these label values."""
+        self._functions[labels] = function
+
+    def samples(self):
+        if self.function is not None:
+            yield self.name, (), self.function()
+        elif not self.labelnames:
+            yield self.name, (), self.value
+        for labels, function in list(self._functions.items()):
+            yield self.name, tuple(zip(self.labelnames, labels)), function()
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (last one is +Inf), sum]
+
+    def observe(self, value, labels=()):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in list(self._series.items()):
+            labels = tuple(zip(self.labelnames, labels))
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                running += count
+                yield self.name + "_bucket", labels + (("le", _format_bound(bound)),), running
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, running
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, function=None, labelnames=()):
+        return self.register(Gauge(name, help, function, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        out = []
+        for metric in self._metrics:
+            out.append("# HELP {} {}".format(metric.name, metric.help))
+            out.append("# TYPE {} {}".format(metric.name, type(metric).__name__.lower()))
+            for name, labels, value in metric.samples():
+                out.append("{}{} {}".format(name, _format_labels(labels), _format_value(value)))
+        out.append("")
+        return "\n".join(out)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')
+                                            .replace("\n", "\\n")) for key, value in labels) + "}"
+
+
+def _format_bound(bound):
+    return bound if isinstance(bound, str) else repr(float(bound))
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+async def serve(registry, port, host="127.0.0.1"):
+    """Serve registry.render() to anything that connects to host:port (normally a Prometheus scraper)."""
+    async def handle(reader, writer):
+        try:
+            while (await reader.readline()).strip():  # Skip the request line and headers.
+                pass
+            body = registry.render().encode("utf-8")
+            writer.write(b"HTTP/1.0 200 OK\r\n"
+                         b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self):
+        """Seconds until there's a whole token, as of the last refill."""
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+def sweep_buckets(buckets, now, keep=()):
+    """Drop the buckets in the buckets dict that have refilled completely, except those keyed in keep.
+
+    A full bucket is no different from a new one, so this bounds memory without changing any limit.
+    """
+    for key, bucket in list(buckets.items()):
+        if key not in keep:
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del buckets[key]
+
+
+class OutboundQueue:
+    """Lines waiting to go out to the server, released under flood-control limits.
+
+    Registration, PONG, JOIN and the like jump the queue and aren't rate limited. Everything else is
+    queued per target (the first parameter, e.g. the channel of a PRIVMSG) and has to get a token
+    from both that target's bucket and the global one. Targets are served round-robin, so one busy
+    channel can't starve the others. Whatever is ready is written to the socket in a single write.
+    """
+    PRIORITY_COMMANDS = {"PONG", "PING", "PASS", "CAP", "USER", "NICK", "JOIN", "PART"}
+    MAX_BATCH_BYTES = 4096
+    IDLE_BUCKET_SWEEP = 60  # seconds
+
+    def __init__(self, rate=1.5, burst=8, target_rate=1.0, target_burst=4, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.target_rate = target_rate
+        self.target_burst = target_burst
+        self._clock = clock
+        self._global = TokenBucket(rate, burst, clock())
+        self._buckets = {}  # lowercased target -> TokenBucket
+        self._priority = deque()
+        self._queues = OrderedDict()  # lowercased target -> deque of encoded lines, in round-robin order
+        self._depth = 0
+        self._last_sweep = clock()
+        self._wakeup = asyncio.Event()
+        self._empty = asyncio.Event()
+        self._empty.set()
+
+    @property
+    def depth(self):
+        """How many lines are waiting to be sent."""
+        return self._depth
+
+    def depth_by_target(self):
+        depths = {target: len(lines) for target, lines in self._queues.items()}
+        if self._priority:
+            depths[""] = len(self._priority)
+        return depths
+
+    def put(self, line):
+        """Queue one line (without the newline). Must be called from the event loop's thread."""
+        data = (line + "\n").encode("utf-8")
+        parts = line.split(" ", 2)
+        if parts[0].upper() in self.PRIORITY_COMMANDS:
+            self._priority.append(data)
+        else:
+            target = parts[1].lower() if len(parts) > 1 else ""
+            lines = self._queues.get(target)
+            if lines is None:
+                lines = self._queues[target] = deque()
+            lines.append(data)
+        self._depth += 1
+        self._empty.clear()
+        self._wakeup.set()
+
+    def clear(self):
+        self._priority.clear()
+        self._queues.clear()
+        self._depth = 0
+        self._empty.set()
+
+    def take_batch(self):
+        """Pop every line we're allowed to send right now.
+
+        Returns (lines, delay); delay is how long until the next queued line could go, or None if
+        nothing is left waiting.
+        """
+        now = self._clock()
+        batch = []
+        size = 0
+        while self._priority and size < self.MAX_BATCH_BYTES:
+            data = self._priority.popleft()
+            batch.append(data)
+            size += len(data)
+
+        self._global.refill(now)
+        progress = True
+        while progress and self._queues and size < self.MAX_BATCH_BYTES and self._global.tokens >= 1:
+            progress = False
+            for target in list(self._queues):
+                bucket = self._bucket(target, now)
+                if bucket.tokens < 1 or self._global.tokens < 1 or size >= self.MAX_BATCH_BYTES:
+                    continue
+                lines = self._queues[target]
+                data = lines.popleft()
+                batch.append(data)
+                size += len(data)
+                bucket.tokens -= 1
+                self._global.tokens -= 1
+                progress = True
+                if lines:
+                    self._queues.move_to_end(target)  # Round-robin: let the other targets go next.
+                else:
+                    del self._queues[target]
+
+        self._depth -= len(batch)
+        if now - self._last_sweep > self.IDLE_BUCKET_SWEEP:
+            sweep_buckets(self._buckets, now, keep=self._queues)  # Targets with lines waiting keep their bucket.
+            self._last_sweep = now
+        if not self._depth:
+            self._empty.set()
+            return batch, None
+        if self._priority or size >= self.MAX_BATCH_BYTES:
+            return batch, 0
+        delay = min(self._buckets[target].wait_time() if target in self._buckets else 0 for target in self._queues)
+        return batch, max(delay, self._global.wait_time())
+
+    def _bucket(self, target, now):
+        bucket = self._buckets.get(target)
+        if bucket is None:
+            bucket = self._buckets[target] = TokenBucket(self.target_rate, self.target_burst, now)
+        else:
+            bucket.refill(now)
+        return bucket
+
+    async def run(self, write):
+        """Feed queued lines to the coroutine function write(data) until cancelled."""
+        while True:
+            batch, delay = self.take_batch()
+            if batch:
+                await write(b"".join(batch))
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self, timeout=None):
+        """Wait until every queued line has been handed to write()."""
+        try:
+            await asyncio.wait_for(self._empty.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
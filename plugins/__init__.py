@@ -0,0 +1,108 @@
+"""Bot commands, kept in plugin modules so they can be changed without restarting the bot.
+
+A plugin module registers its commands with @command or @owner_command. A command is a function
+called as command(bot, hostmask, source, reply_to, *args) and returns the reply: a string, a list
+of lines, or None. Plain functions run on the bot's executor; coroutine functions run on the loop.
+
+Plugin modules shouldn't import rollbot (it's usually __main__, so that would load a second copy);
+everything they need from the bot comes in through `bot`, and the shared stores through `stores`.
+"""
+import asyncio
+import functools
+import importlib
+import os
+import threading
+
+DEFAULT_PLUGINS = ["plugins.core", "plugins.moderation", "plugins.activity", "plugins.fun"]
+
+commands = {}  # command name -> function, for every loaded plugin
+_sources = {}  # command name -> name of the plugin module that registered it
+_loaded = {}  # plugin module name -> (module, (mtime_ns, size) of its file when it was loaded)
+_loading = None  # The plugin module being (re)loaded right now.
+_lock = threading.RLock()
+
+
+def command(method):  # A decorator to automatically register and add commands to the bot.
+    commands[method.__name__] = method
+    _sources[method.__name__] = _loading or method.__module__
+    return method
+
+
+def owner_command(method):
+    if asyncio.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def wrapper(bot, hostmask, source, *args):
+            if bot.owner.lower() != source.lower():
+                return "You can't control me {}!".format(source)
+            return await method(bot, hostmask, source, *args)
+    else:
+        @functools.wraps(method)
+        def wrapper(bot, hostmask, source, *args):
+            if bot.owner.lower() != source.lower():
+                return "You can't control me {}!".format(source)
+            return method(bot, hostmask, source, *args)
+
+    wrapper.is_command = True
+    return command(wrapper)
+
+
+def load(names):
+    """Import the named plugin modules, registering their commands. Already loaded ones are skipped."""
+    global _loading
+    with _lock:
+        for name in names:
+            if name in _loaded:
+                continue
+            _loading = name
+            try:
+                module = importlib.import_module(name)
+            finally:
+                _loading = None
+            _loaded[name] = (module, _stamp(module))
+
+
+def reload(force=False):
+    """Reload every plugin module whose file has changed since it was loaded (or all of them, if force).
+
+    Commands a reloaded module no longer defines are dropped. If a module fails to reload, its old
+    commands stay registered. Returns ([reloaded module names], {module name: exception}).
+    """
+    global _loading
+    reloaded = []
+    failed = {}
+    with _lock:
+        for name, (module, stamp) in list(_loaded.items()):
+            current = _stamp(module)
+            if current == stamp and not force:
+                continue
+            previous = {key: function for key, function in commands.items() if _sources.get(key) == name}
+            _unregister(previous)
+            _loading = name
+            try:
+                module = importlib.reload(module)
+            except Exception as e:
+                _unregister([key for key, source in _sources.items() if source == name])
+                for key, function in previous.items():
+                    commands[key] = function
+                    _sources[key] = name
+                failed[name] = e
+                continue
+            finally:
+                _loading = None
+            _loaded[name] = (module, current)
+            reloaded.append(name)
+    return reloaded, failed
+
+
+def _unregister(names):
+    for key in list(names):
+        commands.pop(key, None)
+        _sources.pop(key, None)
+
+
+def _stamp(module):
+    try:
+        stat = os.stat(module.__file__)
+    except (OSError, TypeError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
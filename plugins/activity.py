@@ -0,0 +1,80 @@
+"""Commands about who has been around: last seen, recent messages, message counts, and tells."""
+import time
+
+import stores
+from plugins import command
+
+
+@command
+def track(bot, hostmask, source, reply_to, *args):
+    irc_track = stores.modlist.get()  # Only re-read when modlist.json changes.
+    cutoff = time.time() - 2 * 7 * 24 * 60 * 60
+    inactive_mods = []
+    for x in irc_track:
+        last_seen = stores.mods[x].get("ts") if x in stores.mods else None
+        if last_seen is None or last_seen < cutoff:
+            inactive_mods.append(x)
+    inactive_mods = ' '.join(inactive_mods)
+    return 'mods inactive for two weeks: {}'.format(inactive_mods)
+
+
+@command
+def seen(bot, hostmask, source, reply_to, *args):
+    name = ' '.join(args)
+    if name not in stores.mods:
+        return "Sorry, haven't seen that weenie"
+    if name in stores.mods:
+        import arrow  # Only loaded once someone asks.
+        timeseen = arrow.get(stores.mods[name]["ts"])
+        formattime = timeseen.format(('YYYY-MM-DD HH:mm:ss ZZ'))
+        humantime = timeseen.humanize()
+        return "{} was seen {} ({}) saying {}".format(name,humantime, formattime, stores.mods[name]["message"])
+
+
+@command
+def history(bot, hostmask, source, reply_to, nick=None, *args):
+    if nick is None:
+        return "Who? Try {}history <nick>".format(bot.command_prefix)
+    recent = stores.activity_log.history(nick, 3)
+    if not recent:
+        return "Sorry, haven't seen that weenie"
+    return ["[{}] {} <{}> {}".format(time.strftime("%m-%d %H:%M", time.gmtime(ts)), channel, nick, message)
+            for ts, channel, message in recent]
+
+
+@command
+def stats(bot, hostmask, source, reply_to, nick=None, *args):
+    if nick is None:
+        hourly = stores.activity_log.channel_hourly(reply_to, 24)
+        return "{}: {} messages in the last hour, {} in the last 24 hours ({:.1f} an hour)".format(
+            reply_to, hourly[-1], sum(hourly), sum(hourly) / 24)
+    hourly = stores.activity_log.user_hourly(nick, 24)
+    if hourly is None:
+        return "Sorry, haven't seen that weenie"
+    daily = stores.activity_log.user_daily(nick, 7)
+    return "{}: {} messages in the last 24 hours, {} in the last 7 days".format(nick, sum(hourly), sum(daily))
+
+
+@command
+def active(bot, hostmask, source, reply_to, *args):
+    top = stores.activity_log.most_active(5)
+    if not top:
+        return "Nobody has said anything this week."
+    return "Most active this week: {}".format(", ".join("{} ({})".format(nick, count) for nick, count in top))
+
+
+@command
+def tell(bot, hostmask, source, reply_to, *args):
+    target = args[0]
+    message = ' '.join(args[1:])
+    #mods[source_nick] = {"date":str(arrow.utcnow()), "message":message_dict['message'], "channel":message_dict['destination']}
+    # tell_message[target] = {"source":source, "message":message, "date":str(arrow.utcnow())}
+    # if tell_message.search(Query().target.test(lambda s: s.lower() == target.lower)):
+    if target.lower() == "Smalls":
+        return "Don't be a weenus"
+    if stores.tell_message.count(target, source) <= 4:
+        import arrow
+        stores.tell_message.add(target, source, message, str(arrow.utcnow()))
+        return "Ok! I'll pass that on when they become active"
+    else:
+        return "U message that person like wayyy too much"
@@ -0,0 +1,121 @@
+"""The command list and the owner's commands for running the bot."""
+import asyncio
+import re
+
+import log_pipeline
+import plugins
+import profiler
+import stores
+from plugins import command, owner_command
+
+
+@command
+def commands(bot, hostmask, source, reply_to, *args):
+    return "Available commands: {}".format(", ".join(sorted(plugins.commands)))
+
+
+@owner_command
+async def dump(bot, hostmask, source, reply_to, n=None, *args):
+    lines = bot.raw_lines.recent(int(n) if n and n.isdigit() else None)
+    await bot.loop.run_in_executor(bot.executor, log_pipeline.write_lines, bot.dump_file, lines)
+    return "Wrote the last {} server lines to {}".format(len(lines), bot.dump_file)
+
+
+@owner_command
+async def reload(bot, hostmask, source, reply_to, *args):
+    # Runs on the loop, so no command is dispatched while the registry is half swapped.
+    reloaded, failed = plugins.reload(force="all" in args)
+    replies = ["Reloaded {}.".format(", ".join(reloaded))] if reloaded else []
+    for name, error in failed.items():
+        bot.logger.error("Reloading {} failed: {!r}", name, error)
+        replies.append("Couldn't reload {}, kept the old version: {!r}".format(name, error))
+    return replies or "No command modules have changed."
+
+
+@owner_command
+async def profile(bot, hostmask, source, reply_to, *args):
+    """!profile [<seconds> | <n>msgs] [cprofile | sample]: profile the bot, then PM the owner a summary."""
+    if profiler.active is not None:
+        return "Already profiling; the results are on their way."
+    mode, seconds, messages = "cprofile", 10, None
+    for arg in args:
+        amount = re.fullmatch(r"(\d+)(s|msgs?)?", arg.lower())
+        if arg.lower() in profiler.MODES:
+            mode = arg.lower()
+        elif amount and amount.group(2) in (None, "s"):
+            seconds = min(int(amount.group(1)), MAX_PROFILE_SECONDS)
+        elif amount:
+            messages, seconds = int(amount.group(1)), MAX_PROFILE_SECONDS
+        else:
+            return "Usage: profile [<seconds> | <n>msgs] [cprofile | sample]"
+    session = profiler.active = profiler.MODES[mode]()
+    session.start()
+    bot.spawn(_finish_profile(bot, session, source, seconds, messages))
+    return "Profiling ({}) for {}. I'll PM you the results.".format(
+        mode, "{} messages".format(messages) if messages else "{} seconds".format(seconds))
+
+
+MAX_PROFILE_SECONDS = 300
+
+
+async def _finish_profile(bot, session, owner, seconds, messages):
+    try:
+        if messages is None:
+            await asyncio.sleep(seconds)
+        else:
+            target = bot.lines_seen + messages
+            deadline = bot.loop.time() + seconds
+            while bot.lines_seen < target and bot.loop.time() < deadline:
+                await asyncio.sleep(0.1)
+    finally:
+        session.stop()
+        profiler.active = None
+    filename = profiler.profile_filename(bot.profile_dir, session)
+    summary = await bot.loop.run_in_executor(bot.executor, session.save, filename)
+    bot.send_message(owner, "Saved {}. Where the time went:".format(filename))
+    for line in summary:
+        bot.send_message(owner, line)
+
+
+@owner_command
+def quit(bot, hostmask, source, reply_to, *args):
+    bot.logger.warn("Shutting down by request of {}", source)
+    bot.send_raw("QUIT :{}'s out!".format(bot.nick))
+    stores.mods.flush()  # Not close(): bots on other networks may still be using it. It's closed at exit.
+    bot.stop()
+
+
+@owner_command
+def join(bot, hostmask, source, reply_to, channel=None, *args):
+    if channel is None:
+        return "Please specify a channel you wish me to join."
+    else:
+        bot.logger.info("Joining {} by request of {}".format(channel, source))
+        bot.join_channel(channel)
+
+
+@owner_command
+def part(bot, hostmask, source, reply_to, channel=None, *args):
+    if reply_to == source and channel is None:  # If this was a private message, we have no channel to leave.
+        return "Sorry, you must run this command in a channel or provide a channel as an argument."
+    elif channel is not None:
+        if channel in bot.channels:
+            bot.leave_channel(channel)
+            return "Left channel {}!".format(channel)
+        else:
+            return "I don't believe I'm in that channel!"
+    else:  # It was a channel message, so let's leave.
+        bot.leave_channel(reply_to)
+
+
+@owner_command
+def say(bot, hostmask, source, reply_to, channel=None, *args):
+    if reply_to != source:
+        return "{} {}".format(channel, ' '.join(args))
+    elif channel is not None:
+        if channel in bot.channels:
+            bot.send_message(channel, ' '.join(args))
+        else:
+            return "Whoops! I'm not in the channel {}".format(channel)
+    else:
+        return "The format is: |say <channel> <message>"
@@ -0,0 +1,9 @@
+"""Random lines from the bundled text files; any arguments search them (or pick who to aim at)."""
+from corpus import corpus_command
+from plugins import command
+
+fortune = command(corpus_command("fortune", "fortune.txt", "{source}: {line}"))
+flirt = command(corpus_command("flirt", "flirt.txt", "{target}: {line}", targeted=True))
+iwish = command(corpus_command("iwish", "iWishTagProWas.txt", "I wish TagPro was {line}"))
+raccoon = command(corpus_command("raccoon", "raccoons.txt"))
+insult = command(corpus_command("insult", "insults.txt", "{target}: {line}", targeted=True))
@@ -0,0 +1,176 @@
+"""Commands for getting hold of a mod, going on and off duty, and looking up IPs."""
+import re
+import time
+
+from ip_reputation import extract_ip
+from plugins import command
+
+
+@command
+def mods(bot, hostmask, source, reply_to, *args):
+    if reply_to != "#TPmods":
+        if source in ["WOLOWOLO", "justanotheruser", "MRCOW", "LEBRONxJAMES", "defense_bot"]:
+            return "can you not"
+        else:
+            return "Sorry! You must use this command in the channel #TPmods | Double click the channel to join."
+    else:
+        if ' '.join(args) == "":
+            return "{} - Please recall !mods with a reason to notify a moderator.".format(source)
+        else:
+            actualipp = extract_ip(hostmask)
+            if actualipp is not None:
+                ippfinal = " ( http://tagpro-origin.koalabeast.com/moderate/ips/{} )".format(actualipp)
+            else:
+                ippfinal = ""
+            members = bot.channel_members("#TPmods")
+            modlist = " ".join(nick for nick, modes in members.items() if 'v' in modes and 'o' not in modes)
+            #oplist = " ".join(nick for nick, modes in members.items() if 'o' in modes)
+            oplist = ""
+            modmsg = "- " + ' '.join(args)
+            if ' '.join(args) == "":
+                modmsg = ""
+            if modlist == "" and oplist == "":
+                bot.send_raw(
+                    "PRIVMSG #TPmods :Sorry {}, all mods are currently AFK. You can stick around or leave your request for one to find later.".format(
+                        source))
+            else:
+                bot.send_raw("PRIVMSG #TagProMods :Mods - {} {}".format(modlist, oplist))
+                bot.send_raw(
+                    "PRIVMSG #TPmods :{} - the mods have received your request. Please stay patient while waiting. Make sure to state the user/issue to speed up the request process.".format(
+                        source))
+                bot.send_raw(
+                    "PRIVMSG #TagProMods :Mod request from {}{} in {} {}".format(source, ippfinal, reply_to,
+                                                                                 modmsg))
+
+
+@command
+def check(bot, hostmask, source, reply_to, *args):
+    ipaddress = ' '.join(args)
+    if re.match('^[-0-9.]*$', ipaddress):
+        ipaddress = ipaddress.replace("-", ".")
+    else:
+        return "Sorry, that's not an IP address!"
+    score = bot.ip_reputation.lookup(ipaddress)
+    return "{}: chances of naughty IP = {}%".format(source, int(score * 100))
+
+
+@command
+def ip(bot, hostmask, source, reply_to, *args):
+    ipaddress = ' '.join(args)
+    if re.match('^[-0-9.]*$', ipaddress):
+        return ipaddress.replace("-", ".")
+    else:
+        return "Sorry, that's not an IP address!"
+
+
+@command
+def ticket(bot, hostmask, source, reply_to, tickett=None, *args):
+    if tickett is None:
+        return "http://support.koalabeast.com/#/appeal"
+    else:
+        return "http://support.koalabeast.com/#/appeal/{}".format(tickett)
+
+
+@command
+def warn(bot, hostmask, source, reply_to, *args):
+    if reply_to != "#TagProMods":
+        return "Sorry! This command is not authorized here."
+    if time.time() - bot.last_warn < bot.warn_interval:
+        return "You're using that too much."
+    bot.send_raw("NOTICE #TPmods :Please take off-topic discussion to #tagpro")
+    bot.last_warn = time.time()
+
+
+@command
+def optin(bot, hostmask, source, reply_to, *args):
+    if reply_to not in ["#TagProMods","#tagprochat"]:
+        return "Sorry! This command is not authorized here."
+    if reply_to == "#TagProMods":
+        modes = bot.channel_modes("#TPmods", source)
+        duty = "duty"
+        if modes is not None and 'v' in modes:
+            return "You are already on {}, {}.".format(duty, source)
+        elif modes is not None:
+            bot.send_raw("PRIVMSG Chanserv :voice #TPmods {}".format(source))
+            return "You are now on {}, {}.".format(duty, source)
+        else:
+            return "You are not in #TPmods, {}!".format(source)
+    if reply_to == "#tagprochat":
+        modes = bot.channel_modes("#tagprochat", source)
+        duty = "duty"
+        if modes is not None and 'v' in modes:
+            return "You are already on {}, {}.".format(duty, source)
+        elif modes is not None:
+            bot.send_raw("PRIVMSG Chanserv :voice #tagprochat {}".format(source))
+            return "You are now on {}, {}.".format(duty, source)
+        else:
+            return "You are not in #tagprochat, {}!".format(source)
+
+
+@command
+def optout(bot, hostmask, source, reply_to, *args):
+    if reply_to not in ["#TagProMods","#tagprochat"]:
+        return "Sorry! This command is not authorized here."
+    if reply_to == "#TagProMods":
+        modes = bot.channel_modes("#TPmods", source)
+        duty = "duty"
+        if source == "Hootie":
+            duty = "dootie"
+        if modes is not None and 'v' in modes:
+            bot.send_raw("PRIVMSG Chanserv :devoice #TPmods {}".format(source))
+            if source.lower() in ['cignul9']:
+                return "Eat my shorts {}".format(source)
+            else: return "You are now off {}, {}.".format(duty, source)
+        elif modes is not None:
+            return "You are already off {}, {}.".format(duty, source)
+        else:
+            return "You are not in #TPmods, {}!".format(source)
+    if reply_to == "#tagprochat":
+        modes = bot.channel_modes("#tagprochat", source)
+        duty = "duty"
+        if source == "Hootie":
+            duty = "dootie"
+        if modes is not None and 'v' in modes:
+            bot.send_raw("PRIVMSG Chanserv :devoice #tagprochat {}".format(source))
+            if source.lower() in ['cignul9']:
+                return "{} is a dink".format(source)
+            else: return "You are now off {}, {}.".format(duty, source)
+        elif modes is not None:
+            return "You are already off {}, {}.".format(duty, source)
+        else:
+            return "You are not in #tagprochat, {}!".format(source)
+
+
+@command
+def op(bot, hostmask, source, reply_to, *args):
+    if reply_to != "#TagProMods":
+        return "Sorry! This command is not authorized here."
+    else:
+        modes = bot.channel_modes("#TPmods", source)
+        if modes is not None and 'o' in modes:
+            return "You are already an operator, {}.".format(source)
+        elif modes is not None:
+            bot.send_raw("PRIVMSG Chanserv :op #TPmods {}".format(source))
+            return "You are now an operator, {}.".format(source)
+        else:
+            return "You are not in #TPmods, {}!".format(source)
+
+
+@command
+def deop(bot, hostmask, source, reply_to, *args):
+    if reply_to != "#TagProMods":
+        return "Sorry! This command is not authorized here."
+    else:
+        modes = bot.channel_modes("#TPmods", source)
+        if modes is not None and 'o' in modes:
+            bot.send_raw("PRIVMSG Chanserv :deop #TPmods {}".format(source))
+            return "You are no longer an operator, {}.".format(source)
+        elif modes is not None:
+            return "You are not an operator, {}.".format(source)
+        else:
+            return "You are not in #TPmods, {}!".format(source)
+
+
+@command
+def netsplit(bot, hostmask, source, reply_to, *args):
+    return "technically we all netsplit http://pastebin.com/mPanErhR"
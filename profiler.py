@@ -0,0 +1,114 @@
+"""Profiling the running bot on request.
+
+Two kinds of session, started and stopped from the event loop's thread:
+
+  CProfileSession   cProfile on the loop's thread: parsing, dispatch, store writes and async
+                    commands, with exact call counts. Saved as a pstats file.
+  SamplingSession   samples every thread's stack (the loop and the command workers, so blocking
+                    commands like check show up too) a few hundred times a second from a background
+                    thread. Saved as collapsed stacks, the input format of flamegraph.pl/speedscope.
+
+Nothing here runs unless a session is started; stopping it removes every hook.
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+# (file name, function) pairs where a thread is just waiting for something to do.
+IDLE_FRAMES = {("selectors.py", "select"), ("thread.py", "_worker"), ("threading.py", "wait"),
+               ("queue.py", "get")}
+# The same, for cProfile, which names the builtins the loop blocks in rather than their callers.
+IDLE_CALLS = {"<method 'poll' of 'select.epoll' objects>", "<method 'select' of 'select.poll' objects>",
+              "<method 'control' of 'select.kqueue' objects>", "<built-in method select.select>"}
+
+
+def _label(code):
+    return "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class CProfileSession:
+    extension = ".pstats"
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def save(self, filename, top=10):
+        """Write the pstats file and return summary lines for the top functions by their own time."""
+        self._profile.dump_stats(filename)
+        stats = pstats.Stats(self._profile)
+        busy = [(key, row) for key, row in stats.stats.items() if key[2] not in IDLE_CALLS]
+        rows = sorted(busy, key=lambda item: item[1][2], reverse=True)[:top]
+        total = sum(row[2] for _, row in busy) or 1
+        return ["{:.0%} {:.1f}ms {}x {} ({}:{})".format(tottime / total, tottime * 1000, calls, name,
+                                                         os.path.basename(path), line)
+                for (path, line, name), (_, calls, tottime, _, _) in rows]
+
+
+class SamplingSession:
+    extension = ".collapsed"
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.idle = 0
+        self._stacks = Counter()  # "thread;outer;...;inner" -> samples
+        self._leaves = Counter()  # innermost frame label -> samples, busy threads only
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                name = names.get(ident)
+                if name is None:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    name = names.get(ident, str(ident))
+                code = frame.f_code
+                self.samples += 1
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    self.idle += 1
+                else:
+                    self._leaves[_label(code)] += 1
+                stack = []
+                while frame is not None:
+                    stack.append(_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(name)
+                self._stacks[";".join(reversed(stack))] += 1
+
+    def save(self, filename, top=10):
+        """Write the collapsed stacks and return summary lines for the busiest innermost frames."""
+        with open(filename, "w") as f:
+            for stack, count in self._stacks.most_common():
+                f.write("{} {}\n".format(stack, count))
+        busy = self.samples - self.idle or 1
+        return ["{:.0%} {}".format(count / busy, label) for label, count in self._leaves.most_common(top)]
+
+
+MODES = {"cprofile": CProfileSession, "sample": SamplingSession}
+active = None  # The running session, if any. There's only ever one per process.
+
+
+def profile_filename(directory, session):
+    return os.path.join(directory, "profile-{}{}".format(time.strftime("%Y%m%d-%H%M%S"), session.extension))
@@ -3,65 +3,120 @@
 # import os, sys
 
 # Import what's needed.
-import socket
+import asyncio
+import concurrent.futures
+import functools
+import signal
 import time
 import json
-import sys
-import re
-import requests
-import arrow
-from json_dict import JSONDict
-from tinydb import TinyDB, Query
-
-
-mods = JSONDict("mods.json")
-tell_message = TinyDB('tell.json')
-
-
-from logbook import Logger
-commands = set()
-
-
-def command(method):  # A decorator to automatically register and add commands to the bot.
-    commands.add(method.__name__)
-    return method
-
-
-def owner_command(method):
-    method.is_command = True
-
-    def wrapper(self, hostmask, source, *args):
-        if self.owner.lower() != source.lower():
-            return "You can't control me {}!".format(source)
-        return method(self, hostmask, source, *args)
-
-    wrapper.is_command = True
-    return wrapper
+import log_pipeline
+import metrics
+import plugins
+import stores
+from backoff import Backoff
+from channel_state import ChannelState
+from command_limits import CommandLimiter
+from ip_reputation import IPReputation
+from irc_connection import IRCConnection, decode_line, open_connection
+from irc_parser import parse
+from outbound import OutboundQueue
+
+registry = metrics.Registry()  # Served in Prometheus format on config['metrics_port'].
+lines_received = registry.counter("rollbot_lines_received_total", "Lines read from the server.")
+lines_sent = registry.counter("rollbot_lines_sent_total", "Lines written to the server.")
+parse_seconds = registry.histogram("rollbot_parse_seconds", "Time spent parsing each server line.")
+dispatch_seconds = registry.histogram("rollbot_dispatch_seconds", "Time the read loop spent handling each line after parsing it.")
+command_seconds = registry.histogram("rollbot_command_seconds", "How long each command took to produce its reply.", ("command",))
+command_errors = registry.counter("rollbot_command_errors_total", "Commands that raised or timed out.", ("command", "reason"))
+commands_throttled = registry.counter("rollbot_commands_throttled_total", "Commands dropped by the flood limits.", ("command", "limit"))
+flush_seconds = registry.histogram("rollbot_persistence_flush_seconds", "Time spent writing a store to disk.", ("store",))
+reconnects = registry.counter("rollbot_reconnects_total", "Times the bot had to reconnect to the server.", ("bot",))
+since_ping = registry.gauge("rollbot_seconds_since_last_ping", "Seconds since the server last pinged us.", labelnames=("bot",))
+queue_depth = registry.gauge("rollbot_outbound_queue_depth", "Lines waiting in the outbound queue.", labelnames=("bot",))
+stores.flush_observer = lambda store, seconds: flush_seconds.observe(seconds, (store,))
+ip_reputations = {}  # JSON of an 'ipintel' config section -> the IPReputation every bot with that section shares
+
+
+from logbook import Logger, lookup_level
 
 
 class RollBot:
     CONFIG_LOCATION = "./config.json"
+    MAX_JOIN_LENGTH = 400  # bytes of channel names per JOIN line, well inside IRC's 512-byte limit
 
-    def __init__(self):
-        self.command_list = {}
-        self.logger = Logger('RollBot', level=2)
-        self.logger.info("RollBot started.")
+    def __init__(self, config=None, executor=None):
+        """config is this bot's settings (see load_configs); by default they're read from CONFIG_LOCATION.
+        Bots running in the same process can share an executor for their blocking commands."""
         self.last_ping = None
         self.registered = False
 
-        with open(self.CONFIG_LOCATION) as f:
-            self.config = json.load(f)
+        if config is None:
+            with open(self.CONFIG_LOCATION) as f:
+                config = json.load(f)
+        self.config = config
+        self.name = self.config.get('name') or default_name(self.config)  # Tells the networks apart in logs and metrics.
+        logging = self.config.get('logging', {})
+        log_pipeline.install(logging)  # Formatting and writing happen on a background thread.
+        self.logger = Logger('RollBot[{}]'.format(self.name) if 'name' in self.config else 'RollBot',
+                             level=lookup_level(logging.get('level', 'INFO')))
+        self.logger.info("RollBot started.")
+        self.raw_lines = log_pipeline.RawLineLog(self.logger, logging.get('ring_size', 1000),
+                                                 logging.get('sample_raw_lines', 0))
+        self.dump_file = logging.get('dump_file', 'recent_lines.log')
+        self.profile_dir = self.config.get('profile_dir', '.')  # Where the profile command saves its results.
         self.nick = self.config['botnick']
         self.owner = self.config['owner']['nick']
         self.channels = set([x.lower() for x in self.config['channel']])
         self.command_prefix = self.config['prefix']
 
-        self.command_list = {x: getattr(self, x) for x in commands}
-        print("Added {} commands: {}".format(len(self.command_list), ", ".join(self.command_list.keys())))
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket_file = self.socket.makefile(encoding="utf-8", errors="ignore")
+        plugins.load(self.config.get('plugins', plugins.DEFAULT_PLUGINS))  # Shared by every bot in the process.
+        self.logger.info("Added {} commands: {}", len(self.command_list), ", ".join(self.command_list.keys()))
         self.warn_interval = 5  # seconds
         self.last_warn = -self.warn_interval  # To allow using the warn command instantly.
+        self.command_limits = CommandLimiter(**self.config.get('rate_limits', {}))  # Per user and command, and per channel.
+
+        # Commands run as their own tasks. Plain (blocking) commands run on this pool so they can't stall the loop.
+        self.command_timeout = self.config.get('command_timeout', 10)  # seconds
+        # How long a command waits for a NAMES reply before making do with the cached member list.
+        self.names_timeout = self.config.get('names_timeout', self.command_timeout / 4)
+        self._owns_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.config.get('command_workers', 8),
+                                                             thread_name_prefix="command")
+        self.executor = executor
+        self.loop = None
+        self.connection = None
+        self.outbound = None
+        self.stopping = False
+        self._tasks = set()
+        self.channel_state = ChannelState(self.nick)
+        ipintel = self.config.get('ipintel', {})
+        key = json.dumps(ipintel, sort_keys=True)
+        if key not in ip_reputations:
+            ip_reputations[key] = IPReputation(**ipintel)
+        self.ip_reputation = ip_reputations[key]  # One cache (and cache file) however many networks use it.
+
+        # The connection is re-established with jittered exponential backoff. It counts as dead once the
+        # server has been silent for idle_timeout seconds and then doesn't answer our PING in ping_timeout.
+        reconnect = self.config.get('reconnect', {})
+        self.backoff = Backoff(reconnect.get('initial_delay', 1), reconnect.get('max_delay', 300))
+        self.connect_timeout = reconnect.get('connect_timeout', 30)
+        self.idle_timeout = reconnect.get('idle_timeout', 120)
+        self.ping_timeout = reconnect.get('ping_timeout', 60)
+        self.last_received = 0.0  # loop.time() of the last line from the server
+        self._stopped = None
+        since_ping.track((self.name,), lambda: time.time() - self.last_ping if self.last_ping else None)
+        queue_depth.track((self.name,), lambda: self.outbound.depth if self.outbound else 0)
+
+    @property
+    def lines_seen(self):
+        """Lines received from the server so far, by every bot in the process."""
+        return lines_received.value
+
+    @property
+    def command_list(self):
+        """Every registered command, by name. Reloading a plugin updates it in place."""
+        return plugins.commands
 
     def send_message(self, channel, message):
         message_template = "PRIVMSG {} :{}"
@@ -76,6 +131,21 @@ class RollBot:
         if channel:
             message_template = "JOIN {}"
             self.send_raw(message_template.format(channel))
+            self.channels.add(channel.lower())  # So we rejoin it after a reconnect.
+
+    def join_channels(self, channels):
+        """Join channels using as few JOIN lines as possible."""
+        batch = []
+        length = 0
+        for channel in channels:
+            if batch and length + len(channel) > self.MAX_JOIN_LENGTH:
+                self.send_raw("JOIN " + ",".join(batch))
+                batch = []
+                length = 0
+            batch.append(channel)
+            length += len(channel) + 1
+        if batch:
+            self.send_raw("JOIN " + ",".join(batch))
 
     def leave_channel(self, channel):
         if channel in self.channels:
@@ -84,79 +154,197 @@ class RollBot:
             self.channels.remove(channel)
 
     def connect(self):
-        server_information = (self.config['server'], self.config['port'])
-        self.socket.connect(server_information)
+        try:
+            asyncio.run(run_bots([self], self.config))
+        finally:
+            stores.close()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        flood_control = self.config.get('flood_control', {})
+        self.outbound = OutboundQueue(**flood_control)
+        self._stopped = asyncio.Event()
+        try:
+            while not self.stopping:
+                try:
+                    await self.run_connection()
+                except (OSError, asyncio.TimeoutError) as e:
+                    self.logger.error("Connection to {}:{} failed: {}", self.config['server'], self.config['port'], e)
+                except Exception as e:  # A bug, not the network, but reconnecting is still the best way out.
+                    self.logger.exception("Connection to {}:{} crashed: {}", self.config['server'], self.config['port'], e)
+                if self.stopping:
+                    break
+                delay = self.backoff.next_delay()
+                self.logger.error("Disconnected. Reconnecting in {:.1f} seconds.", delay)
+                reconnects.inc(labels=(self.name,))
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self._owns_executor:
+                self.executor.shutdown(wait=False)
+
+    async def run_connection(self):
+        """Connect, register and handle server lines until the connection closes or goes dead.
+
+        Everything kept in memory (mods, tells, caches, the channel list) carries over to the next
+        connection; channels are only marked stale until the rejoin refreshes them.
+        """
+        connecting = open_connection(self.config['server'], self.config['port'],
+                                     max_line_length=self.config.get('max_line_length', IRCConnection.MAX_LINE_LENGTH))
+        self.connection = await asyncio.wait_for(connecting, self.connect_timeout)
+        self.outbound.clear()  # Whatever was queued belonged to the old connection.
+        self.last_received = self.loop.time()
+        sender = self.loop.create_task(self.outbound.run(self.write))
+        watchdog = self.loop.create_task(self.watch_connection())
         self.send_raw("PASS " + self.config['password'])
+        self.send_raw("CAP REQ :multi-prefix")  # So NAMES shows every prefix a member has.
         self.send_raw("USER {} {} {} :{}".format(self.nick, self.nick, self.nick, "rollbot"))
         self.send_raw("NICK " + self.nick)
-        self.run_loop()
+        try:
+            await self.run_loop()
+        finally:
+            sender.cancel()
+            watchdog.cancel()
+            self.connection.close()
+            self.registered = False
+            self.channel_state.disconnected()
+
+    async def watch_connection(self):
+        """Abort the connection if the server goes quiet and then doesn't answer a PING."""
+        while True:
+            quiet = self.loop.time() - self.last_received
+            if quiet < self.idle_timeout:
+                await asyncio.sleep(self.idle_timeout - quiet)
+                continue
+            pinged_at = self.loop.time()
+            self.send_raw("PING :" + self.nick)
+            await asyncio.sleep(self.ping_timeout)
+            if self.last_received < pinged_at:
+                self.logger.error("No reply to PING for {} seconds; the connection is dead.", self.ping_timeout)
+                self.connection.transport.abort()  # close() would wait for writes that will never go through.
+                return
+
+    def stop(self):
+        """Close the connection once the outbound queue has drained, and stop reconnecting. Safe to call from any thread."""
+        self.stopping = True
+        if self.loop is None:
+            return  # Not running yet; run() will see stopping and return straight away.
+        if self.in_loop():
+            self.spawn(self.close_when_drained())
+        else:
+            self.loop.call_soon_threadsafe(self.spawn, self.close_when_drained())
 
-    def get_message_from_server(self):
-        return self.socket_file.readline()
+    async def close_when_drained(self, timeout=5):
+        self._stopped.set()
+        await self.outbound.drain(timeout)
+        if self.connection is not None:
+            self.connection.close()
 
-    def run_loop(self):
-        message_regex = r"^(?:[:](?P<prefix>\S+) )" \
-                        r"?(?P<type>\S+)" \
-                        r"(?: (?!:)(?P<destination>.+?))" \
-                        r"?(?: [:](?P<message>.+))?$"  # Extracts all appropriate groups from a raw IRC message
-        compiled_message = re.compile(message_regex)
-        print(compiled_message)
+    async def write(self, data):
+        lines_sent.inc(data.count(b"\n"))
+        self.connection.write(data)
+        await self.connection.drain()  # Lets the transport push back if the server isn't reading.
 
+    def in_loop(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def spawn(self, coroutine):
+        task = self.loop.create_task(coroutine)
+        self._tasks.add(task)  # The loop only keeps weak references to tasks.
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def channel_modes(self, channel, nick):
+        """The prefix modes ("v", "o") nick has in channel, or None if they're not in it.
+
+        Answered from the channel cache; only asks the server for NAMES when the cache might be stale.
+        """
+        if self.channel_state.needs_sync(channel):
+            self.send_raw("NAMES " + channel)
+            self.channel_state.wait_synced(channel, self.names_timeout)
+        return self.channel_state.modes(channel, nick)
+
+    def channel_members(self, channel):
+        if self.channel_state.needs_sync(channel):
+            self.send_raw("NAMES " + channel)
+            self.channel_state.wait_synced(channel, self.names_timeout)
+        return self.channel_state.members(channel)
+
+    async def run_loop(self):
         while True:
+            line = await self.connection.readline()
+            if not line:
+                return  # Connection closed.
+            self.last_received = self.loop.time()
+            self.raw_lines.record(line)  # Kept for the dump command; only a sample is logged.
+            message = decode_line(line)  # UTF-8, or latin-1 from older clients.
+            lines_received.value += 1
+            started = time.perf_counter()
+            parsed = parse(message)
+            parsed_at = time.perf_counter()
+            parse_seconds.observe(parsed_at - started)
+            if parsed is None:
+                continue
             try:
-                message = self.get_message_from_server()
-                self.logger.debug("Received server message: {}", message)
-                parsed_message = compiled_message.finditer(message)
-                message_dict = [m.groupdict() for m in parsed_message][0]  # Extract all the named groups into a dict
-                source_nick = ""
-                hostmask = ""
-                ircmsg = message.strip('\n\r')  # remove new lines
-                print(ircmsg.encode("ascii", errors="ignore"))
-
-                if message_dict['prefix'] is not None:
-                    if "!" in message_dict['prefix']:  # Is the prefix from a nickname?
-                        hostmask = message_dict['prefix'].split("@")[1]
-                        source_nick = message_dict['prefix'].split("!")[0]
-
-                if message_dict['type'] == "PING":
-                    self.send_ping(message_dict['message'])
-
-                if message_dict['type'] == "PRIVMSG":
-                    self.handle_message(hostmask, source_nick, message_dict['destination'], message_dict['message'])
-                    # if source_nick not in mods:
-                    #     mods[source_nick] = {"date":str(arrow.utcnow()), "message":message_dict['message'], "channel":message_dict['destination']}
-                    # if source_nick != "TagChatBot":
-                    if message_dict['destination'] == '#TagProMods':
-                        mods[source_nick] = {"date":str(arrow.utcnow()), "message":message_dict['message'], "channel":message_dict['destination']}
-                    else:
-                        continue  # u dork
-                    while tell_message.contains(Query().target.test(lambda s: s.lower() == source_nick.lower())) and message_dict['destination'] == "#TagProMods":
-                        name = tell_message.get(Query().target.test(lambda s: s.lower() == source_nick.lower()))
-                        date_remove = name['date']
-                        self.send_message(source_nick,"{}, {} left a message: \"{}\"".format(source_nick, name['source'], name['message']))
-                        tell_message.remove(Query().date.test(lambda s: s.lower() == date_remove.lower()))
-                        time.sleep(.1)
-
-
-                if message_dict['type'] == "001":  # Registration confirmation message
-                    self.registered = True
-                    self.logger.info("{} connected to server successfully.", self.nick)
-                    for channel in self.config['channel']:
-                        self.logger.info("Attempting to join {}", channel)
-                        self.join_channel(channel)
-
-            except socket.timeout:
-                self.logger.error("Disconnected. Attempting to reconnect.")
-                self.socket.close()
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.connect()
+                self.handle_line(parsed)
+            except Exception as e:  # One odd line mustn't cost us the connection.
+                self.logger.exception("Error handling server line {!r}: {}", message, e)
+            finally:
+                dispatch_seconds.observe(time.perf_counter() - parsed_at)
+
+    def handle_line(self, parsed):
+        source_nick = parsed.nick or ""
+        hostmask = parsed.host or ""
+        params = parsed.args
+        self.channel_state.handle(source_nick, parsed.command, params)
+
+        if parsed.command == "CAP" and len(params) >= 2 and params[1] in ("ACK", "NAK"):
+            self.send_raw("CAP END")
+
+        if parsed.command == "PING":
+            self.send_ping(params[-1] if params else "")  # PONGs jump the outbound queue.
+
+        if parsed.command == "PRIVMSG" and len(params) >= 2:
+            destination, text = params[0], params[-1]
+            self.handle_message(hostmask, source_nick, destination, text)
+            # if source_nick not in mods:
+            #     mods[source_nick] = {"ts":time.time(), "message":text, "channel":destination}
+            # if source_nick != "TagChatBot":
+            if destination == '#TagProMods':
+                now = time.time()
+                stores.mods[source_nick] = {"ts":now, "message":text, "channel":destination}
+                for name in stores.tell_message.pop_all(source_nick):  # Empty, without touching the disk, if there's no mail.
+                    self.send_message(source_nick, "{}, {} left a message: \"{}\"".format(source_nick, name['source'], name['message']))
+            if destination.startswith('#'):  # Last, so a problem with the activity store can't hold up mods or tells.
+                stores.activity_log.record(source_nick, destination, text)
+
+        if parsed.command == "001":  # Registration confirmation message
+            self.registered = True
+            self.channel_state.nick = self.nick = params[0]
+            self.logger.info("{} connected to server successfully.", self.nick)
+            self.backoff.reset()
+            self.logger.info("Attempting to join {}", ", ".join(sorted(self.channels)))
+            self.join_channels(sorted(self.channels))  # Everything we were in, config channels or not.
 
     def handle_message(self, hostmask, source, destination, message):
         is_command = message.startswith(self.config['prefix'])
         if is_command:
-            self.handle_command(hostmask, source, destination, message)
+            self.spawn(self.handle_command(hostmask, source, destination, message))
+
+    async def run_command(self, command, *args):
+        """Run a command with the per-command timeout. Blocking commands are sent to the executor."""
+        if asyncio.iscoroutinefunction(command):
+            pending = command(*args)
+        else:
+            pending = self.loop.run_in_executor(self.executor, functools.partial(command, *args))
+        return await asyncio.wait_for(pending, self.command_timeout)
 
-    def handle_command(self, hostmask, source, destination, message):
+    async def handle_command(self, hostmask, source, destination, message):
         try:
             split_message = message[1:].split()
             command_key = split_message[0].lower()
@@ -168,10 +356,23 @@ class RollBot:
         try:
             if destination == self.nick:
                 reply_to = source  # If it's a private message, reply to the source. Otherwise it's a channel message and reply there.
-            if command_key in self.command_list:
+            command = self.command_list.get(command_key)
+            if command is not None:
+                if source.lower() != self.owner.lower():
+                    limit = self.command_limits.check(hostmask or source, command_key,
+                                                      None if reply_to == source else reply_to)
+                    if limit is not None:
+                        commands_throttled.inc(labels=(command_key, limit))
+                        self.logger.debug("Throttled command '{}' from {} ({} limit)", command_key, source, limit)
+                        if self.command_limits.should_notify(hostmask or source):
+                            self.send_raw("NOTICE {} :You're sending commands too fast; I'll ignore them for a bit.".format(source))
+                        return
                 self.logger.info("Received command '{}' from {}", command_key, source)
-                command = self.command_list[command_key]
-                return_message = command(hostmask, source, reply_to, *arguments)
+                started = time.perf_counter()
+                try:
+                    return_message = await self.run_command(command, self, hostmask, source, reply_to, *arguments)
+                finally:
+                    command_seconds.observe(time.perf_counter() - started, (command_key,))
                 if return_message is not None:
                     if isinstance(return_message, str):  # Is it a string?
                         self.send_message(reply_to, return_message)  # If so, just send it along.
@@ -182,280 +383,102 @@ class RollBot:
                 pass
                 # combined_command = self.command_prefix + command_key
                 # self.send_message(reply_to, "Sorry, {} isn't a recognized command.".format(combined_command))
+        except asyncio.TimeoutError:
+            command_errors.inc(labels=(command_key, "timeout"))
+            self.send_message(reply_to, "Sorry, that command took too long.")
+            self.logger.warn("Command {} timed out after {} seconds", command_key, self.command_timeout)
         except Exception as e:
+            command_errors.inc(labels=(command_key, "exception"))
             self.send_message(reply_to, "Sorry, I encountered an error while running that command.")
-            print("Exception in command {}: {}".format(command_key, e))
+            self.logger.exception("Exception in command {}: {}", command_key, e)
+
     def send_raw(self, message):
-        return self.socket.send((message + "\n").encode("utf-8"))
+        if self.in_loop():
+            self.outbound.put(message)
+        else:  # Called from a command running on the executor.
+            self.loop.call_soon_threadsafe(self.outbound.put, message)
 
     def update_ping_time(self):
         self.last_ping = time.time()
 
-    # Commands
-
-    @command
-    def track(self, hostmask, source, reply_to, *args):
-        with open('modlist.json') as f:
-            irc_track = json.load(f)
-            time = arrow.get((arrow.utcnow().replace(weeks=-2)))
-            inactive_mods = [x for x in irc_track if x not in mods or arrow.get(mods[x]['date']) < time]
-            inactive_mods = ' '.join(inactive_mods)
-            return 'mods inactive for two weeks: {}'.format(inactive_mods)
-
-    @command
-    def commands(self, hostmask, source, reply_to, *args):
-        return "Available commands: {}".format(", ".join(sorted(self.command_list.keys())))
-
-    @command
-    def netsplit(self, hostmask, source, reply_to, *args):
-        return "technically we all netsplit http://pastebin.com/mPanErhR"
-
-    @command
-    def mods(self, hostmask, source, reply_to, *args):
-        if reply_to != "#TPmods":
-            if source in ["WOLOWOLO", "justanotheruser", "MRCOW", "LEBRONxJAMES", "defense_bot"]:
-                return "can you not"
-            else:
-                return "Sorry! You must use this command in the channel #TPmods | Double click the channel to join."
-        else:
-            if ' '.join(args) == "":
-                return "{} - Please recall !mods with a reason to notify a moderator.".format(source)
-            else:
-                self.send_raw("NAMES #TPmods")
-                message = self.get_message_from_server()
-                ircmsg = message.strip('\n\r')
-                try:
-                    actualip = "{}".format(re.findall(r'\b(?:\d{1,3}[\.-]){3}\d{1,3}\b', hostmask)[0])
-                    actualipp = actualip.replace("-", ".")
-                    ippfinal = " ( http://tagpro-origin.koalabeast.com/moderate/ips/{} )".format(actualipp)
-                except IndexError:
-                    ippfinal = ""
-                if ircmsg.find(' 353 {} '.format(self.nick)) != -1:
-                    namelist = ircmsg.split(":")[2]
-                    modlist = " ".join(x[1:] for x in namelist.split() if x.startswith('+'))
-                    #oplist = " ".join(x[1:] for x in namelist.split() if x.startswith('@'))
-                    oplist = ""
-                    modmsg = "- " + ' '.join(args)
-                    if ' '.join(args) == "":
-                        modmsg = ""
-                    if modlist == "" and oplist == "":
-                        self.send_raw(
-                            "PRIVMSG #TPmods :Sorry {}, all mods are currently AFK. You can stick around or leave your request for one to find later.".format(
-                                source))
-                    else:
-                        self.send_raw("PRIVMSG #TagProMods :Mods - {} {}".format(modlist, oplist))
-                        self.send_raw(
-                            "PRIVMSG #TPmods :{} - the mods have received your request. Please stay patient while waiting. Make sure to state the user/issue to speed up the request process.".format(
-                                source))
-                        self.send_raw(
-                            "PRIVMSG #TagProMods :Mod request from {}{} in {} {}".format(source, ippfinal, reply_to,
-                                                                                         modmsg))
-
-    @command
-    def check(self, hostmask, source, reply_to, *args):
-        ipaddress = ' '.join(args)
-        if re.match('^[-0-9.]*$', ipaddress):
-            ipaddress = ipaddress.replace("-", ".")
-        else:
-            return "Sorry, that's not an IP address!"
-        with open('email.txt') as e:
-            email = e.read().strip()
-        page = requests.get('http://check.getipintel.net/check.php?ip={}&contact={}'.format(ipaddress, email))
-        return "{}: chances of naughty IP = {}%".format(source, int(float(re.findall("(\d+(?:.\d+)?)", page.text)[0]) * 100))
-
-    @command
-    def seen(self, hostmask, source, reply_to, *args):
-        name = ' '.join(args)
-        if name not in mods:
-            return "Sorry, haven't seen that weenie"
-        if name in mods:
-            timeseen = arrow.get(mods[name]["date"])
-            formattime = timeseen.format(('YYYY-MM-DD HH:mm:ss ZZ'))
-            humantime = timeseen.humanize()
-            return "{} was seen {} ({}) saying {}".format(name,humantime, formattime, mods[name]["message"])
-
-    @command
-    def tell(self, hostmask, source, reply_to, *args):
-        target = args[0]
-        message = ' '.join(args[1:])
-        #mods[source_nick] = {"date":str(arrow.utcnow()), "message":message_dict['message'], "channel":message_dict['destination']}
-        # tell_message[target] = {"source":source, "message":message, "date":str(arrow.utcnow())}
-        # if tell_message.search(Query().target.test(lambda s: s.lower() == target.lower)):
-        if target.lower() == "Smalls":
-            return "Don't be a weenus"
-            nick = tell_message.get(Query().target.test(lambda s: s.lower() == target.lower()))
-        if tell_message.count(Query().target.test(lambda s: s.lower() == target.lower()) & Query().source.test(lambda s: s.lower() == source.lower())) <= 4:
-            tell_message.insert({"target":target,"message":message, 'date':str(arrow.utcnow()), 'source':source})
-            return "Ok! I'll pass that on when they become active"
-        else:
-            return "U message that person like wayyy too much"
-
-    @command
-    def optin(self, hostmask, source, reply_to, *args):
-        if reply_to not in ["#TagProMods","#tagprochat"]:
-            return "Sorry! This command is not authorized here."
-        if reply_to == "#TagProMods":
-            self.send_raw("NAMES #TPmods")
-            message = self.get_message_from_server()
-            ircmsg = message.strip('\n\r')
-            duty = "duty"
-            if ircmsg.find('+{}'.format(source)) != -1:
-                print(ircmsg.find('+{}'.format(source)))
-                return "You are already on {}, {}.".format(duty, source)
-            elif ircmsg.find('{}'.format(source)) != -1:
-                print(ircmsg.find('{}'.format(source)))
-                self.send_raw("PRIVMSG Chanserv :voice #TPmods {}".format(source))
-                return "You are now on {}, {}.".format(duty, source)
-            else:
-                return "You are not in #TPmods, {}!".format(source)
-        if reply_to == "#tagprochat":
-            self.send_raw("NAMES #tagprochat")
-            message = self.get_message_from_server()
-            ircmsg = message.strip('\n\r')
-            duty = "duty"
-            if ircmsg.find('+{}'.format(source)) != -1:
-                return "You are already on {}, {}.".format(duty, source)
-            elif ircmsg.find('{}'.format(source)) != -1:
-                self.send_raw("PRIVMSG Chanserv :voice #tagprochat {}".format(source))
-                return "You are now on {}, {}.".format(duty, source)
-            else:
-                return "You are not in #tagprochat, {}!".format(source)
-
-    @command
-    def optout(self, hostmask, source, reply_to, *args):
-        if reply_to not in ["#TagProMods","#tagprochat"]:
-            return "Sorry! This command is not authorized here."
-        if reply_to == "#TagProMods":
-            self.send_raw("NAMES #TPmods")
-            message = self.get_message_from_server()
-            ircmsg = message.strip('\n\r')
-            duty = "duty"
-            if source == "Hootie":
-                duty = "dootie"
-            if ircmsg.find('+{}'.format(source)) != -1:
-                self.send_raw("PRIVMSG Chanserv :devoice #TPmods {}".format(source))
-                if source.lower() in ['cignul9']:
-                    return "Eat my shorts {}".format(source)
-                else: return "You are now off {}, {}.".format(duty, source)
-            elif ircmsg.find('{}'.format(source)) != -1:
-                return "You are already off {}, {}.".format(duty, source)
-            else:
-                return "You are not in #TPmods, {}!".format(source)
-        if reply_to == "#tagprochat":
-            self.send_raw("NAMES #tagprochat")
-            message = self.get_message_from_server()
-            ircmsg = message.strip('\n\r')
-            duty = "duty"
-            if source == "Hootie":
-                duty = "dootie"
-            if ircmsg.find('+{}'.format(source)) != -1:
-                self.send_raw("PRIVMSG Chanserv :devoice #tagprochat {}".format(source))
-                if source.lower() in ['cignul9']:
-                    return "{} is a dink".format(source)
-                else: return "You are now off {}, {}.".format(duty, source)
-            elif ircmsg.find('{}'.format(source)) != -1:
-                return "You are already off {}, {}.".format(duty, source)
-            else:
-                return "You are not in #tagprochat, {}!".format(source)
 
-    @command
-    def op(self, hostmask, source, reply_to, *args):
-        if reply_to != "#TagProMods":
-            return "Sorry! This command is not authorized here."
-        else:
-            self.send_raw("NAMES #TPmods")
-            message = self.get_message_from_server()
-            ircmsg = message.strip('\n\r')
-            if ircmsg.find('@{}'.format(source)) != -1:
-                return "You are already an operator, {}.".format(source)
-            elif ircmsg.find('{}'.format(source)) != -1:
-                self.send_raw("PRIVMSG Chanserv :op #TPmods {}".format(source))
-                return "You are now an operator, {}.".format(source)
-            else:
-                return "You are not in #TPmods, {}!".format(source)
+def load_configs(filename=RollBot.CONFIG_LOCATION):
+    """Read filename and return (the whole config, [the config for each bot]).
 
-    @command
-    def deop(self, hostmask, source, reply_to, *args):
-        if reply_to != "#TagProMods":
-            return "Sorry! This command is not authorized here."
-        else:
-            self.send_raw("NAMES #TPmods")
-            message = self.get_message_from_server()
-            ircmsg = message.strip('\n\r')
-            if ircmsg.find('@{}'.format(source)) != -1:
-                self.send_raw("PRIVMSG Chanserv :deop #TPmods {}".format(source))
-                return "You are no longer an operator, {}.".format(source)
-            elif ircmsg.find('{}'.format(source)) != -1:
-                return "You are not an operator, {}.".format(source)
-            else:
-                return "You are not in #TPmods, {}!".format(source)
+    If it has a "networks" list, there's a bot for each entry: the top-level settings with that
+    entry's keys (server, port, botnick, channel, name...) layered on top, and a name of
+    "botnick@server" unless the entry gives one. Otherwise the top level describes the only bot.
+    """
+    with open(filename) as f:
+        config = json.load(f)
+    networks = config.pop('networks', None)
+    if not networks:
+        return config, [config]
+    configs = []
+    for network in networks:
+        merged = dict(config, **network)
+        merged['name'] = network.get('name') or default_name(merged)
+        if any(other['name'] == merged['name'] for other in configs):
+            raise ValueError("More than one network is named {!r}; give each a distinct \"name\"".format(merged['name']))
+        configs.append(merged)
+    return config, configs
 
-    @command
-    def ticket(self, hostmask, source, reply_to, tickett=None, *args):
-        if tickett is None:
-            return "http://support.koalabeast.com/#/appeal"
-        else:
-            return "http://support.koalabeast.com/#/appeal/{}".format(tickett)
 
-    @command
-    def ip(self, hostmask, source, reply_to, *args):
-        ipaddress = ' '.join(args)
-        if re.match('^[-0-9.]*$', ipaddress):
-            return ipaddress.replace("-", ".")
-        else:
-            return "Sorry, that's not an IP address!"
-
-    @command
-    def warn(self, hostmask, source, reply_to, *args):
-        if reply_to != "#TagProMods":
-            return "Sorry! This command is not authorized here."
-        if time.time() - self.last_warn < self.warn_interval:
-            return "You're using that too much."
-        self.send_raw("NOTICE #TPmods :Please take off-topic discussion to #tagpro")
-        self.last_warn = time.time()
-
-    @owner_command
-    def quit(self, hostmask, source, reply_to, *args):
-        self.logger.warn("Shutting down by request of {}", source)
-        self.send_raw("QUIT :{}'s out!".format(self.nick))
-        self.socket.shutdown(1)
-        self.socket.close()
-        sys.exit()
-
-    @owner_command
-    def join(self, hostmask, source, reply_to, channel=None, *args):
-        if channel is None:
-            return "Please specify a channel you wish me to join."
-        else:
-            self.logger.info("Joining {} by request of {}".format(channel, source))
-            self.join_channel(channel)
-
-    @owner_command
-    def part(self, hostmask, source, reply_to, channel=None, *args):
-        if reply_to == source and channel is None:  # If this was a private message, we have no channel to leave.
-            return "Sorry, you must run this command in a channel or provide a channel as an argument."
-        elif channel is not None:
-            if channel in self.channels:
-                self.leave_channel(channel)
-                return "Left channel {}!".format(channel)
-            else:
-                return "I don't believe I'm in that channel!"
-        else:  # It was a channel message, so let's leave.
-            self.leave_channel(reply_to)
-
-    @owner_command
-    def say(self, hostmask, source, reply_to, channel=None, *args):
-        if reply_to != source:
-            return "{} {}".format(channel, ' '.join(args))
-        elif channel is not None:
-            if channel in self.channels:
-                self.send_message(channel, ' '.join(args))
-            else:
-                return "Whoops! I'm not in the channel {}".format(channel)
-        else:
-            return "The format is: |say <channel> <message>"
+def default_name(config):
+    return "{}@{}".format(config['botnick'], config['server'])
+
+
+async def run_bots(bots, config):
+    """Run bots side by side on this event loop until every one of them has quit.
+
+    They share the stores (mods, tells, activity), whose writes are serialized by their own locks,
+    the commands, and the metrics registry, which is served once on config's metrics_port.
+    """
+    if 'metrics_port' in config:
+        await metrics.serve(registry, config['metrics_port'], config.get('metrics_host', '127.0.0.1'))
+    loop = asyncio.get_running_loop()
+
+    async def preload():  # Opens the stores while we connect.
+        try:
+            await loop.run_in_executor(None, stores.preload)
+        except Exception as e:
+            bots[0].logger.exception("Couldn't preload the stores; they'll be opened when first used: {}", e)
+
+    async def supervise(bot):  # So one network's crash can't take the others down with it.
+        try:
+            await bot.run()
+        except Exception as e:
+            bot.logger.exception("{} stopped: {}", bot.name, e)
+
+    def shut_down():  # On SIGTERM (how Heroku stops a dyno) or Ctrl-C: quit cleanly, so the stores get saved.
+        for bot in bots:
+            bot.stop()
+
+    signals = []
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, shut_down)
+            signals.append(signum)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows, or not the main thread.
+    try:
+        await asyncio.gather(preload(), *(supervise(bot) for bot in bots))
+    finally:
+        for signum in signals:
+            loop.remove_signal_handler(signum)
+
+
+def main():
+    config, networks = load_configs()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.get('command_workers', 8),
+                                                     thread_name_prefix="command")
+    bots = [RollBot(network, executor) for network in networks]
+    try:
+        asyncio.run(run_bots(bots, config))
+    finally:
+        executor.shutdown(wait=False)
+        stores.close()
 
 
 if __name__ == "__main__":
-    bot = RollBot()
-    bot.connect()
+    main()
@@ -0,0 +1,89 @@
+"""The bot's persistent state, shared by every network and every command module.
+
+Each store is opened the first time it's used (stores.mods, stores.tell_message...), not when this
+module is imported; preload() opens them all, e.g. on a worker thread while the bot connects. This
+module is never reloaded, so the stores outlive reloads of the command modules that use them.
+"""
+import atexit
+import threading
+from datetime import datetime
+
+from activity_store import ActivityStore
+from json_dict import JournaledJSONDict, WatchedJSONFile
+from tell_store import TellStore
+
+flush_observer = None  # Called with (store name, seconds) after each write to disk, if set.
+_lock = threading.RLock()
+
+
+def _flushed(name):
+    def on_flush(seconds):
+        if flush_observer is not None:
+            flush_observer(name, seconds)
+    return on_flush
+
+
+def _open_mods():
+    mods = JournaledJSONDict("mods.json")  # Written on every #TagProMods message, so batch the writes.
+    atexit.register(mods.close)
+    _migrate_dates(mods)  # Older mods.json files stored arrow date strings.
+    mods.on_flush = _flushed("mods")
+    return mods
+
+
+def _migrate_dates(records):
+    """Convert records that still carry an arrow "date" string to an epoch "ts"."""
+    for nick, record in list(records.items()):
+        if not isinstance(record, dict) or "ts" in record or "date" not in record:
+            continue
+        try:
+            ts = datetime.fromisoformat(record["date"]).timestamp()
+        except (TypeError, ValueError):
+            continue  # Left without a timestamp, like a nick that was never seen.
+        record = dict(record)
+        del record["date"]
+        record["ts"] = ts
+        records[nick] = record
+
+
+def _open_activity_log():
+    activity_log = ActivityStore('activity.dat')  # Recent messages and message counts, for history/stats/active.
+    atexit.register(activity_log.close)
+    return activity_log
+
+
+def _open_tell_message():
+    tell_message = TellStore('tell.json')
+    tell_message.on_flush = _flushed("tell")
+    return tell_message
+
+
+_OPENERS = {
+    "mods": _open_mods,
+    "modlist": lambda: WatchedJSONFile('modlist.json'),
+    "activity_log": _open_activity_log,
+    "tell_message": _open_tell_message,
+}
+
+
+def __getattr__(name):  # Only called for stores that haven't been opened yet.
+    opener = _OPENERS.get(name)
+    if opener is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    with _lock:
+        if name not in globals():
+            globals()[name] = opener()
+    return globals()[name]
+
+
+def preload():
+    for name in _OPENERS:
+        __getattr__(name)
+
+
+def close():
+    """Write out the stores that buffer their writes. Stores that were never opened are left alone."""
+    with _lock:
+        opened = [globals()[name] for name in ("mods", "activity_log") if name in globals()]
+    for store in opened:
+        store.close()
@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from json_dict import atomic_write
+
+
+class TellStore:
+    """Offline messages ("tells"), indexed by lowercased target nick.
+
+    Reads and writes the same layout TinyDB used for tell.json ({"_default": {"<id>": {...}}}), so
+    existing files load unchanged and stay readable by TinyDB. Every lookup is a dict hit; each
+    mutation rewrites the file once.
+    """
+    TABLE = "_default"
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._lock = threading.Lock()
+        self._tables = {}  # Other TinyDB tables found in the file, kept so we write them back untouched.
+        self._by_target = {}  # lowercased target -> [(doc_id, record), ...] in insertion order
+        self._quota = Counter()  # (lowercased target, lowercased source) -> pending message count
+        self._next_id = 1
+        self.on_flush = None  # Optional callback, called with the seconds spent on each write.
+        self.load()
+
+    def load(self):
+        try:
+            with open(self._filename) as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        self._tables = json.loads(data) if data.strip() else {}
+        records = self._tables.pop(self.TABLE, {})
+        for doc_id, record in sorted(records.items(), key=lambda item: int(item[0])):
+            self._index(int(doc_id), record)
+            self._next_id = max(self._next_id, int(doc_id) + 1)
+
+    def _index(self, doc_id, record):
+        target = record["target"].lower()
+        self._by_target.setdefault(target, []).append((doc_id, record))
+        self._quota[target, record["source"].lower()] += 1
+
+    def count(self, target, source):
+        """How many messages from source are waiting for target."""
+        return self._quota[target.lower(), source.lower()]
+
+    def add(self, target, source, message, date=None):
+        record = {"target": target, "message": message, "date": date or _utcnow(), "source": source}
+        with self._lock:
+            self._index(self._next_id, record)
+            self._next_id += 1
+            self._save()
+        return record
+
+    def pop_all(self, nick):
+        """Remove and return every message waiting for nick, oldest first, in a single write.
+
+        If the write fails the messages stay where they were, and the exception is raised.
+        """
+        target = nick.lower()
+        if target not in self._by_target:  # Cheap "nobody has mail" path, no lock taken.
+            return []
+        with self._lock:
+            pending = self._by_target.pop(target, [])
+            if not pending:
+                return []
+            for _, record in pending:
+                key = (target, record["source"].lower())
+                self._quota[key] -= 1
+                if self._quota[key] <= 0:
+                    del self._quota[key]
+            try:
+                self._save()
+            except Exception:
+                self._by_target[target] = pending
+                for _, record in pending:
+                    self._quota[target, record["source"].lower()] += 1
+                raise
+        return [record for _, record in pending]
+
+    def __len__(self):
+        return sum(len(pending) for pending in self._by_target.values())
+
+    def _save(self):
+        started = time.perf_counter()
+        records = {}
+        for pending in self._by_target.values():
+            for doc_id, record in pending:
+                records[str(doc_id)] = record
+        tables = dict(self._tables)
+        tables[self.TABLE] = records
+        atomic_write(self._filename, json.dumps(tables))
+        if self.on_flush is not None:
+            self.on_flush(time.perf_counter() - started)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).isoformat()  # Same text as str(arrow.utcnow())